@@ -0,0 +1,91 @@
+"""
+Compare the serialization formats of the file storages.
+
+Writes and reads a generated database with every storage and reports the
+best encode (write) and decode (read) time and the resulting file size:
+
+    $ python benchmarks/bench_codecs.py --elements 100000
+    $ python benchmarks/bench_codecs.py --json > codecs.json
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from tinydb.storages import (JSONStorage, MarshalStorage, PickleStorage,
+                             MsgPackStorage, msgpack)
+
+
+def make_data(elements, tables=1):
+    """
+    Generate a database with elements looking like typical documents.
+    """
+    rnd = random.Random(42)  # Reproducible
+
+    return dict([
+        ('table{}'.format(t), dict([
+            (id, {'name': 'user{}'.format(id),
+                  'age': rnd.randint(0, 100),
+                  'score': rnd.random(),
+                  'active': rnd.random() > 0.5,
+                  'tags': ['tag{}'.format(rnd.randint(0, 20))
+                           for _ in range(3)]})
+            for id in range(1, elements + 1)
+        ]))
+        for t in range(tables)
+    ])
+
+
+def bench(storage_cls, data, repeat):
+    directory = tempfile.mkdtemp()
+
+    try:
+        storage = storage_cls(os.path.join(directory, 'db'))
+
+        write = min(timeit.repeat(lambda: storage.write(data),
+                                  number=1, repeat=repeat))
+        read = min(timeit.repeat(storage.read, number=1, repeat=repeat))
+        size = os.path.getsize(storage.path)
+    finally:
+        shutil.rmtree(directory)
+
+    return {'storage': storage_cls.__name__, 'write': write, 'read': read,
+            'size': size}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--elements', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    args = parser.parse_args()
+
+    storages = [JSONStorage, MarshalStorage, PickleStorage]
+    if msgpack is not None:
+        storages.append(MsgPackStorage)
+
+    data = make_data(args.elements)
+    results = [bench(storage, data, args.repeat) for storage in storages]
+
+    if args.json:
+        json.dump({'elements': args.elements, 'results': results},
+                  sys.stdout, indent=2)
+        return
+
+    print('{:<16} {:>10} {:>10} {:>12}'.format('storage', 'write (s)',
+                                              'read (s)', 'size (bytes)'))
+    for result in results:
+        print('{storage:<16} {write:>10.4f} {read:>10.4f} {size:>12}'.format(
+            **result))
+
+
+if __name__ == '__main__':
+    main()
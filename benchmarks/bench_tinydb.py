@@ -0,0 +1,202 @@
+"""
+Measure the throughput of the table operations on different storages.
+
+Runs bulk loading, inserting, searching (with different query shapes),
+getting and removing elements on databases of the given sizes and reports
+the best time per operation:
+
+    $ python benchmarks/bench_tinydb.py --elements 1000,10000
+    $ python benchmarks/bench_tinydb.py --json > before.json
+    $ python benchmarks/bench_tinydb.py --compare before.json
+
+Inserting and removing write the whole table with most storages, so use a
+small ``--ops`` for large databases.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+from timeit import default_timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from tinydb import TinyDB, field
+from tinydb.middlewares import CachingMiddleware, ConcurrencyMiddleware
+from tinydb.storages import JSONStorage, MemoryStorage
+
+from bench_codecs import make_data
+
+
+STORAGES = [
+    ('JSONStorage', lambda: JSONStorage),
+    ('MemoryStorage', lambda: MemoryStorage),
+    ('CachingMiddleware', lambda: CachingMiddleware(JSONStorage)),
+    ('ConcurrencyMiddleware', lambda: ConcurrencyMiddleware(JSONStorage)),
+]
+
+#: The queries run by the search benchmarks. The field ``age`` is indexed
+#: for the ``*_indexed`` ones.
+QUERIES = [
+    ('eq', lambda: field('age') == 42),
+    ('range', lambda: (field('age') >= 20) & (field('age') < 30)),
+    ('and', lambda: (field('age') == 42) & (field('active') == True)),
+    ('or', lambda: (field('age') == 42) | (field('age') == 43)),
+    ('regex', lambda: field('name').matches('user1.*5$')),
+    ('custom', lambda: field('tags').test(lambda tags: 'tag1' in tags)),
+]
+INDEXED = ('eq', 'range', 'and', 'or')
+
+
+def best(func, repeat, setup=None):
+    """
+    Get the best time of running ``func`` ``repeat`` times. ``setup`` is run
+    before each run and its result is passed to ``func``.
+    """
+    times = []
+
+    for _ in range(repeat):
+        arg = setup() if setup else None
+
+        start = default_timer()
+        func(arg)
+        times.append(default_timer() - start)
+
+    return min(times)
+
+
+def bench(storage_factory, elements, args):
+    """
+    Run all operations on one storage with a database of ``elements``
+    elements.
+
+    :returns: the seconds per operation by the operations' names
+    :rtype: dict
+    """
+    rnd = random.Random(42)
+    documents = list(make_data(elements)['table0'].values())
+    extra = list(make_data(args.ops)['table0'].values())
+    directory = tempfile.mkdtemp()
+    results = {}
+
+    def open_db(name='db.json'):
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+        return TinyDB(path, storage=storage_factory())
+
+    try:
+        # Bulk load into an empty database
+        results['bulk_load'] = best(
+            lambda db: db.insert_multiple(documents), args.repeat,
+            setup=lambda: open_db('bulk.json'))
+
+        # Single operations on a loaded database
+        # The query cache would answer repeated searches without running them
+        table = open_db().table('bench', cache_size=0)
+        table.insert_multiple(documents)
+
+        def insert(_):
+            for element in extra:
+                table.insert(element)
+
+        def inserted():
+            # The keys as stored, not all storages keep them as ints
+            keys = set(table.all(as_dict=True))
+            insert(None)
+            return list(set(table.all(as_dict=True)) - keys)
+
+        def remove(keys):
+            for key in keys:
+                table.remove(key)
+
+        results['insert'] = best(insert, args.repeat,
+                                 setup=lambda: remove(inserted())) / args.ops
+        results['remove'] = best(remove, args.repeat,
+                                 setup=inserted) / args.ops
+
+        keys = list(table.all(as_dict=True))
+        sample = [rnd.choice(keys) for _ in range(args.ops)]
+        results['get_id'] = best(lambda _: [table.get(key) for key in sample],
+                                 args.repeat) / args.ops
+        results['get_query'] = best(
+            lambda _: table.get(field('name') == 'user{}'.format(elements)),
+            args.repeat)
+
+        for name, make_query in QUERIES:
+            results['search_' + name] = best(
+                lambda _: table.search(make_query()), args.repeat)
+
+        table.create_index('age', ordered=True)
+        for name, make_query in QUERIES:
+            if name in INDEXED:
+                results['search_{}_indexed'.format(name)] = best(
+                    lambda _: table.search(make_query()), args.repeat)
+    finally:
+        shutil.rmtree(directory)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--elements', default='1000,10000',
+                        help='comma separated database sizes '
+                             '(default: %(default)s)')
+    parser.add_argument('--ops', type=int, default=100,
+                        help='the number of single inserts, removes and '
+                             'gets per run (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--storages', default=','.join(n for n, _ in STORAGES),
+                        help='comma separated storages to benchmark')
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare with the JSON results of an earlier run')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.elements.split(',')]
+    storages = [(name, factory) for name, factory in STORAGES
+                if name in args.storages.split(',')]
+
+    results = []
+    for elements in sizes:
+        for name, factory in storages:
+            timings = bench(factory, elements, args)
+            results.extend({'storage': name, 'elements': elements,
+                            'operation': operation, 'seconds': seconds}
+                           for operation, seconds in sorted(timings.items()))
+
+    if args.json:
+        json.dump({'python': platform.python_version(),
+                   'platform': platform.platform(),
+                   'ops': args.ops, 'repeat': args.repeat,
+                   'results': results}, sys.stdout, indent=2)
+        return
+
+    previous = {}
+    if args.compare:
+        with open(args.compare) as handle:
+            for result in json.load(handle)['results']:
+                previous[result['storage'], result['elements'],
+                         result['operation']] = result['seconds']
+
+    print('{:<22} {:>8} {:<20} {:>12} {:>8}'.format(
+        'storage', 'elements', 'operation', 'seconds/op', 'change'))
+    for result in results:
+        key = result['storage'], result['elements'], result['operation']
+        change = ''
+        if previous.get(key):
+            change = '{:+.0%}'.format(result['seconds'] / previous[key] - 1)
+
+        print('{storage:<22} {elements:>8} {operation:<20} {seconds:>12.6f} '
+              '{change:>8}'.format(change=change, **result))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,12 @@
+from contextlib import contextmanager
+from itertools import islice
+from operator import itemgetter
+
 from tinydb.storages import Storage, JSONStorage
-from tinydb.queries import query, field
+from tinydb.queries import (AndOrMixin, query, field, query_and, query_or,
+                            _fields)
+from tinydb.indexes import HashIndex, SortedIndex
+from tinydb.utils import LRUCache, Stats
 
 __all__ = ('TinyDB',)
 
@@ -25,25 +32,34 @@ class TinyDB(object):
 
     """
 
-    _table_cache = {}
-
     def __init__(self, *args, **kwargs):
         storage = kwargs.pop('storage', JSONStorage)
+        self._stats = Stats(kwargs.pop('stats_callback', None))
         #: :type: Storage
         self._storage = storage(*args, **kwargs)
+        self._storage.attach_stats(self._stats)
+        self._table_cache = {}
+        self._batch = None
+        self._version = self._storage.version()
         self._table = self.table('_default')
 
-    def table(self, name='_default'):
+    def table(self, name='_default', **options):
         """
         Get access to a specific table.
 
         :param name: The name of the table.
         :type name: str
+        :param options: Options passed to :class:`Table`. If the table has
+                        been accessed before, the given options are applied
+                        to it.
         """
         if name in self._table_cache:
-            return self._table_cache[name]
+            table = self._table_cache[name]
+            if options:
+                table._configure(**options)
+            return table
 
-        table = Table(name, self)
+        table = Table(name, self, **options)
         self._table_cache[name] = table
         return table
 
@@ -51,29 +67,204 @@ class TinyDB(object):
         """
         Purge all tables from the database. CANT BE REVERSED!
         """
-        self._write({})
+        with self._transaction():
+            self._write({})
+
+        for table in self._table_cache.itervalues():
+            table._clear_query_cache()
+            table._clear_indexes()
+            table._count = 0
+
+    def stats(self, reset=False):
+        """
+        Get statistics about the operations run so far.
+
+        The timings cover the table operations (``insert``, ``remove``,
+        ``update``, ``search``, ``get``) and the storage access
+        (``storage_read``, ``storage_write``), their ``count`` is the number
+        of operations.
+        The counters include the bytes read and written by the storage
+        (``bytes_read``, ``bytes_written``) and the number of queries that
+        had to test all elements (``full_scans``) or only the candidates
+        found by an index (``index_scans``, ``index_candidates``).
+
+        To export the statistics while they are recorded, pass a
+        ``stats_callback`` to the constructor (see
+        :class:`~tinydb.utils.Stats`).
+
+        :param reset: Whether to reset the statistics afterwards.
+        :type reset: bool
+        :returns: see :meth:`tinydb.utils.Stats.snapshot`
+        :rtype: dict
+        """
+
+        snapshot = self._stats.snapshot()
+        if reset:
+            self._stats.reset()
+
+        return snapshot
+
+    @contextmanager
+    def batch(self):
+        """
+        Group modifications into one single storage write.
+
+        Inside the ``with`` block, all modifications (of any table) are
+        applied to an in-memory working copy. When the block is left, the
+        modified tables are written to the storage at once (atomically, if
+        the storage supports it, see
+        :meth:`~tinydb.storages.Storage.write_tables`). If an exception is
+        raised, the modifications are discarded instead.
+
+        >>> with db.batch():
+        ...     db.insert({'int': 1})
+        ...     db.remove(field('int') == 2)
+
+        Nested batches are part of the outermost one. The whole batch runs
+        in one storage transaction (see :meth:`_transaction`).
+        """
+
+        if self._batch is not None:
+            yield
+            return
+
+        with self._storage.transaction():
+            self._sync()
+
+            self._batch = _Batch(self._table_cache)
+            try:
+                yield
+            except:
+                batch, self._batch = self._batch, None
+                self._rollback(batch)
+                raise
+            else:
+                batch, self._batch = self._batch, None
+                try:
+                    self._commit(batch)
+                except:
+                    self._rollback(batch)
+                    raise
+
+            self._version = self._storage.version()
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Run a modification exclusively (see
+        :meth:`~tinydb.storages.Storage.transaction`), after noticing changes
+        made by others.
+        """
+
+        if self._batch is not None:
+            yield  # Part of the batch's transaction
+            return
+
+        with self._storage.transaction():
+            self._sync()
+            yield
+            self._version = self._storage.version()
+
+    def _sync(self):
+        """
+        Let the tables forget everything they know about the data (cached
+        queries, indexes, counts, IDs) if the data has been changed by
+        others, e.g. another process sharing the file.
+        """
+
+        version = self._storage.version()
+        if version == self._version:
+            return
+
+        self._version = version
+        for table in self._table_cache.itervalues():
+            table._reload()
+
+    def _commit(self, batch):
+        """
+        Write the modifications of a batch to the storage.
+        """
+
+        if batch.purged:
+            self._write_storage(batch.tables)
+        elif len(batch.dirty) == 1:
+            for name in batch.dirty:
+                self._write_storage(batch.tables[name], name)
+        elif batch.dirty:
+            # All at once, so the batch is written atomically if the storage
+            # supports it (see Storage.write_tables)
+            with self._stats.timer('storage_write'):
+                self._storage.write_tables(dict([
+                    (name, batch.tables[name]) for name in batch.dirty
+                ]))
+
+    def _rollback(self, batch):
+        """
+        Discard the modifications of a batch and restore the tables' state.
+        """
+
+        for name, table in self._table_cache.iteritems():
+            table._reload()
+
+            if name in batch.last_ids:
+                table._last_id = batch.last_ids[name]
 
-    def _read(self, table=None):
+    def _read(self, table=None, fields=None):
         """
         Reading access to the backend.
 
         :param table: The table, we want to read, or None to read the 'all
         tables' dict.
         :type table: dict or None
+        :param fields: The fields of the table's elements that are needed,
+                       storages may skip decoding the others (see
+                       :attr:`~tinydb.storages.Storage.supports_field_reads`).
+        :type fields: set or None
         :returns: all values
         :rtype: dict
         """
 
-        if not table:
+        if self._batch is not None:
+            return self._batch.read(self._read_storage, table)
+
+        return self._read_storage(table, fields)
+
+    def _read_element(self, table, id):
+        """
+        Read a single element (see
+        :meth:`~tinydb.storages.Storage.read_element`).
+
+        :raises KeyError: if there is no such element
+        """
+
+        if self._batch is not None:
+            return self._batch.read(self._read_storage, table)[id]
+
+        with self._stats.timer('storage_read'):
             try:
-                return self._storage.read()
-            except ValueError:
-                return {}
+                return self._storage.read_element(table, id)
+            except (TypeError, ValueError):
+                raise KeyError(id)
 
-        try:
-            return self._read()[table]
-        except (KeyError, TypeError):
-            return {}
+    def _read_storage(self, table=None, fields=None):
+        """
+        Read from the backend, bypassing the batch (see :meth:`_read`).
+        """
+
+        with self._stats.timer('storage_read'):
+            if not table:
+                try:
+                    return self._storage.read()
+                except ValueError:
+                    return {}
+
+            try:
+                if fields is not None and self._storage.supports_field_reads:
+                    return self._storage.read_table(table, fields)
+
+                return self._storage.read_table(table)
+            except (KeyError, TypeError, ValueError):
+                return {}
 
     def _write(self, values, table=None):
         """
@@ -86,13 +277,21 @@ class TinyDB(object):
         :type values: dict
         """
 
-        if not table:
-            self._storage.write(values)
+        if self._batch is not None:
+            self._batch.write(values, table)
         else:
-            current_data = self._read()
-            current_data[table] = values
+            self._write_storage(values, table)
 
-            self._write(current_data)
+    def _write_storage(self, values, table=None):
+        """
+        Write to the backend, bypassing the batch (see :meth:`_write`).
+        """
+
+        with self._stats.timer('storage_write'):
+            if not table:
+                self._storage.write(values)
+            else:
+                self._storage.write_table(table, values)
 
     def __len__(self):
         """
@@ -110,12 +309,64 @@ class TinyDB(object):
         return getattr(self._table, name)
 
 
+class _Batch(object):
+    """
+    The working copy of the tables modified inside :meth:`TinyDB.batch`.
+    """
+
+    def __init__(self, tables):
+        self.tables = {}  # name -> working copy of the table
+        self.dirty = set()  # The names of the modified tables
+        self.purged = False  # Whether all tables have been purged
+
+        # To restore the tables' state on rollback
+        self.last_ids = dict((name, table._last_id)
+                             for name, table in tables.iteritems())
+
+    def read(self, read, table):
+        """
+        Read from the working copy, reading through to the storage using
+        ``read`` on first access.
+        """
+
+        if not table:
+            data = {} if self.purged else dict(read())
+            data.update(self.tables)
+            return data
+
+        if table not in self.tables:
+            # Copied, so the storage's data stays untouched until commit
+            self.tables[table] = {} if self.purged else dict(read(table))
+
+        return self.tables[table]
+
+    def write(self, values, table):
+        if not table:
+            self.tables = dict(values)
+            self.dirty = set()
+            self.purged = True
+        else:
+            self.tables[table] = values
+            self.dirty.add(table)
+
+
 class Table(object):
     """
     Represents a single TinyDB Table.
     """
 
-    def __init__(self, name, db):
+    #: The default maximum number of cached query results.
+    QUERY_CACHE_SIZE = 100
+
+    #: The default maximum approximate size of the cached query results
+    #: (in bytes).
+    QUERY_CACHE_MEMORY = 64 * 1024 * 1024
+
+    #: Queries testing fewer elements than this are never run in parallel.
+    PARALLEL_MIN_SIZE = 10000
+
+    def __init__(self, name, db, cache_size=None, cache_memory=None,
+                 processes=None, columnar=False):
         """
         Get access to a table.
 
@@ -123,25 +374,121 @@ class Table(object):
         :type name: str
         :param db: The parent database.
         :type db: TinyDB
+        :param cache_size: The maximum number of cached query results.
+        :type cache_size: int
+        :param cache_memory: The maximum approximate size of the cached
+                             query results in bytes.
+        :type cache_memory: int
+        :param processes: The number of processes to test the elements on,
+                          if a query has to test at least
+                          :attr:`PARALLEL_MIN_SIZE` elements. Worthwhile for
+                          large tables and expensive queries (e.g. regexes
+                          or custom tests). Results are returned in the
+                          order of the IDs. A new pool of processes is
+                          started for every such query, which takes a few
+                          milliseconds. Where processes aren't forked,
+                          queries which can't be pickled (e.g. testing with
+                          a lambda) are tested serially. See
+                          :func:`tinydb.parallel.parallel_filter`.
+        :type processes: int
+        :param columnar: Whether to evaluate queries testing all elements
+                         using a columnar copy of the table (requires
+                         NumPy). Much faster for comparisons of numbers and
+                         strings on large tables. The copy is built on the
+                         first query after a modification. See
+                         :class:`tinydb.columnar.ColumnStore`.
+        :type columnar: bool
         """
         self.name = name
         self._db = db
-        self._queries_cache = {}
+        self._processes = None
+        self._columnar = False
+        self._columns = None
+        self._count = None  # The number of elements, None if unknown
+        self._queries_cache = LRUCache(self.QUERY_CACHE_SIZE,
+                                       self.QUERY_CACHE_MEMORY)
+        self._indexes = {}
+        self._last_id = None  # Found on the first insert
+
+        self._configure(cache_size, cache_memory, processes, columnar)
+
+    def _configure(self, cache_size=None, cache_memory=None, processes=None,
+                   columnar=None):
+        """
+        Change the given options (see :meth:`__init__`), keeping the others.
+        """
+        if columnar:
+            # NumPy (like multiprocessing for parallel scans) is only
+            # imported when needed, so importing TinyDB stays fast
+            from tinydb.columnar import numpy
+            if numpy is None:
+                raise ImportError('Columnar tables require NumPy')
+
+        if columnar is not None:
+            self._columnar = columnar
+            self._columns = None
+
+        if processes is not None:
+            self._processes = processes
+
+        if cache_size is not None or cache_memory is not None:
+            if cache_size is not None:
+                self._queries_cache.capacity = cache_size
+            if cache_memory is not None:
+                self._queries_cache.max_size = cache_memory
+            self._queries_cache.clear()  # May not fit anymore
 
-        try:
-            self._last_id = self._read().keys().pop()
-        except IndexError:
-            self._last_id = 0
+    def _find_last_id(self):
+        # Storages like JSON return the IDs as strings
+        return max([int(id) for id in self._read()] or [0])
 
-    def _read(self):
+    def _reload(self):
+        """
+        Forget everything derived from the table's data, as it has been
+        changed by others.
+        """
+
+        self._clear_query_cache()
+        self._count = None
+        self._last_id = None
+
+        if self._indexes:
+            self._rebuild_indexes(self._read())
+
+    def _read(self, fields=None):
         """
         Reading access to the DB.
 
+        :param fields: see :meth:`TinyDB._read`
         :returns: all values
         :rtype: dict
         """
 
-        return self._db._read(self.name)
+        return self._db._read(self.name, fields)
+
+    def _read_for(self, where, fields):
+        """
+        Read the table for running a query, if possible only the fields
+        needed to test the query and to return the requested fields.
+        """
+
+        needed = _fields(where)
+        if fields is None or needed is None or self._columnar:
+            # The columnar copy needs all fields
+            return self._read()
+
+        return self._read(needed | set(fields))
+
+    @staticmethod
+    def _project(element, fields):
+        """
+        Get only the given fields of an element.
+        """
+
+        if fields is None:
+            return element
+
+        return dict([(key, element[key]) for key in fields if key in element])
 
     def _write(self, values):
         """
@@ -153,18 +500,77 @@ class Table(object):
 
         self._clear_query_cache()
         self._db._write(values, self.name)
+        self._count = len(values)
 
     def __len__(self):
         """
         Get the total number of elements in the table.
         """
-        return len(self.all())
+        return self.count()
 
     def __contains__(self, where):
         """
         Equals to bool(table.search(where)))
         """
-        return bool(self.search(where))
+        return self.contains(where)
+
+    def count(self, where=None):
+        """
+        Count the elements matching a condition.
+
+        Without a condition, the number of elements is known without reading
+        the table, as it's updated on every modification. A query on a
+        single indexed field is counted using only the index, other queries
+        test the elements without building a result list.
+
+        :param where: the condition or None to count all elements
+        :type where: query
+        :rtype: int
+        """
+
+        self._db._sync()
+
+        if where is None:
+            if self._count is None:
+                self._count = len(self._read())
+
+            return self._count
+
+        elems = self._queries_cache.get(repr(where))
+        if elems is not None:
+            return len(elems)
+
+        ids = self._indexed(where)
+        if ids is not None:
+            return len(ids)
+
+        return sum(1 for _ in self._matches(where, self._read()))
+
+    def contains(self, where):
+        """
+        Check whether any element matches a condition.
+
+        Stops testing elements at the first match.
+
+        :param where: the condition
+        :type where: query
+        :rtype: bool
+        """
+
+        self._db._sync()
+
+        elems = self._queries_cache.get(repr(where))
+        if elems is not None:
+            return bool(elems)
+
+        ids = self._indexed(where)
+        if ids is not None:
+            return bool(ids)
+
+        for _ in self._matches(where, self._read(), lazy=True):
+            return True
+
+        return False
 
     def all(self, as_dict=False):
         """
@@ -181,84 +587,284 @@ class Table(object):
         else:
             return self._read().values()
 
+    def batch(self):
+        """
+        Group modifications into one single storage write.
+
+        See :meth:`TinyDB.batch`.
+        """
+        return self._db.batch()
+
+    def create_index(self, key, ordered=False):
+        """
+        Create an index on a field.
+
+        Queries testing the field for equality (also when combined with
+        other queries using ``&`` and ``|``) are then answered by looking up
+        the matching elements in the index instead of testing all elements.
+        An ordered index can answer range queries (``<``, ``<=``, ``>``,
+        ``>=``) too.
+
+        :param key: the name of the field to index
+        :type key: str
+        :param ordered: Whether to create an ordered index instead of a hash
+                        index.
+        :type ordered: bool
+        """
+
+        if ordered:
+            index = SortedIndex(key)
+        else:
+            index = HashIndex(key)
+
+        index.build(self._read())
+        self._indexes[key] = index
+
+    def drop_index(self, key):
+        """
+        Remove the index on a field.
+
+        :param key: the name of the indexed field
+        :type key: str
+        """
+
+        self._indexes.pop(key, None)
+
     def insert(self, element):
         """
         Insert a new element into the table.
 
         element has to be a dict, not containing the key 'id'.
+
+        :returns: the ID of the inserted element
+        :rtype: int
+        """
+
+        return self.insert_multiple([element])[0]
+
+    def insert_multiple(self, elements):
+        """
+        Insert multiple elements into the table.
+
+        All elements are inserted with one single read and write, so this is
+        much faster than calling :meth:`insert` for each of them. Any iterable
+        works, e.g. a generator.
+
+        :param elements: the elements to insert
+        :type elements: iterable
+        :returns: the IDs of the inserted elements
+        :rtype: list
         """
 
-        self._last_id += 1
-        next_id = self._last_id
+        with self._db._stats.timer('insert'), self._db._transaction():
+            data = self._read()
+            last_id = self._last_id
+            if last_id is None:
+                # Not on open, reading a lazy storage's table may be costly
+                last_id = self._find_last_id()
+
+            # The dict may be the storage's live data, so it's only modified
+            # (and the last ID advanced) once the iterable has been consumed
+            # without errors
+            inserted = [(last_id + i, element)
+                        for i, element in enumerate(elements, 1)]
 
-        data = self._read()
-        data[next_id] = element
+            for id, element in inserted:
+                if id in data:
+                    self._index_remove(id, data[id])
+                data[id] = element
+
+            self._last_id = last_id + len(inserted)
+            self._write(data)
 
-        self._write(data)
+            for index in self._indexes.itervalues():
+                index.add_many(inserted)
+
+            return [id for id, _ in inserted]
 
     def remove(self, id):
         """
         Remove the element matching the condition.
 
+        The matching elements are determined first and then removed with one
+        single write.
+
         :param id: the condition or ID or a list of IDs
         :type id: query, int, list
+        :returns: the IDs of the removed elements
+        :rtype: list
         """
 
-        if isinstance(id, field):
-            # Got a query
-            where = id
+        with self._db._stats.timer('remove'), self._db._transaction():
+            data = self._read()
+            ids = self._resolve(id, data)
 
-            to_remove = self.search(where)
-            new_values = dict(
-                [(id, val) for id, val in self._read().iteritems()
-                 if val not in to_remove]
-            )  # We don't use the new dict comprehension to support Python 2.6
+            removed = [(i, data.pop(i)) for i in ids]
+            self._write(data)
 
-            self._write(new_values)
-        elif isinstance(id, list):
-            # Got a list of IDs
-            ids = id
-            for id in ids:
-                self.remove(id)
-        else:
-            # Got an id
+            if len(removed) > len(data):
+                self._rebuild_indexes(data)
+            else:
+                for i, element in removed:
+                    self._index_remove(i, element)
+
+            return ids
+
+    def update(self, fields, where):
+        """
+        Update the elements matching the condition.
+
+        The matching elements are updated with one single read and write.
+        The elements are copied before being updated, so elements returned
+        earlier (e.g. by :meth:`search`) stay unchanged.
+
+        >>> db.update({'status': 'done'}, field('id') == 5)
+        >>> def increment(element):
+        ...     element['count'] += 1
+        >>> db.update(increment, field('id') == 5)
+
+        :param fields: the fields to set or a function modifying an element
+                       in place
+        :type fields: dict, callable
+        :param where: the condition or ID or a list of IDs
+        :type where: query, int, list
+        :returns: the IDs of the updated elements
+        :rtype: list
+        """
+
+        with self._db._stats.timer('update'), self._db._transaction():
             data = self._read()
-            del data[id]
+            ids = self._resolve(where, data)
+            updated = {}
+
+            # The dict may be the storage's live data, so it's only modified
+            # once all elements have been updated without errors
+            for id in ids:
+                element = dict(data[id])
+
+                if callable(fields):
+                    fields(element)
+                else:
+                    element.update(fields)
+
+                updated[id] = element
+
+            old = [(id, data[id]) for id in updated]
+            data.update(updated)
             self._write(data)
 
+            for id, element in old:
+                self._index_remove(id, element)
+                self._index_add(id, updated[id])
+
+            return ids
+
     def purge(self):
         """
         Purge the table by removing all elements.
         """
-        self._write({})
+        with self._db._transaction():
+            self._write({})
+            self._clear_indexes()
 
-    def search(self, where):
+    def search(self, where, limit=None, offset=0, fields=None):
         """
         Search for all elements matching a 'where' condition or get elements
         by a list of IDs.
 
+        If ``limit`` or ``offset`` is given, the search stops as soon as
+        enough elements have been found.
+
+        If ``fields`` is given, the elements are returned with only these
+        fields (if present). The query cache then only keeps these fields
+        too.
+
         :param where: the condition or a list of IDs
         :type where: has, list
+        :param limit: the maximum number of elements to return
+        :type limit: int
+        :param offset: the number of matching elements to skip
+        :type offset: int
+        :param fields: the keys of the fields to return
+        :type fields: list
 
         :returns: list of matching elements
         :rtype: list
         """
 
-        if isinstance(where, list):
-            # Got a list of IDs
-            ids = where
-            return [self.get(id) for id in ids]
-        else:
-            # Got a query
-            if where in self._queries_cache:
-                return self._queries_cache[where]
+        self._db._sync()
+
+        with self._db._stats.timer('search'):
+            end = None if limit is None else offset + limit
+
+            if isinstance(where, list):
+                # Got a list of IDs
+                ids = where[offset:end]
+                data = self._read(None if fields is None else set(fields))
+                return [self._project(data[id], fields) for id in ids]
             else:
-                elems = [e for e in self.all() if where(e)]
-                self._queries_cache[where] = elems
+                # Got a query
+                key = repr(where)
+                elems = self._queries_cache.get(key)
+                projected = fields is None
+
+                if elems is None and fields is not None:
+                    # Maybe cached with this projection
+                    key = (key, tuple(fields))
+                    elems = self._queries_cache.get(key)
+                    projected = True
+
+                if elems is None:
+                    limited = limit is not None or offset
+                    matches = self._matches(where,
+                                            self._read_for(where, fields),
+                                            lazy=limited)
 
-                return elems
+                    if limited:
+                        # Don't cache partial results
+                        return [self._project(e, fields)
+                                for _, e in islice(matches, offset, end)]
 
-    def get(self, id):
+                    elems = [self._project(e, fields) for _, e in matches]
+                    self._queries_cache[key] = elems
+
+                if limit is not None or offset:
+                    elems = elems[offset:end]
+
+                if projected:
+                    return elems
+                else:
+                    return [self._project(e, fields) for e in elems]
+
+    def search_iter(self, where, fields=None):
+        """
+        Iterate over all elements matching a 'where' condition.
+
+        The elements are tested while iterating, so no result list is built
+        and stopping early skips testing the remaining elements.
+
+        :param where: the condition
+        :type where: query
+        :param fields: the keys of the fields to return (see :meth:`search`)
+        :type fields: list
+
+        :returns: an iterator of the matching elements
+        """
+
+        self._db._sync()
+
+        elems = self._queries_cache.get(repr(where))
+
+        if elems is not None:
+            for element in elems:
+                yield self._project(element, fields)
+        else:
+            for _, element in self._matches(where,
+                                            self._read_for(where, fields),
+                                            lazy=True):
+                yield self._project(element, fields)
+
+    def get(self, id, fields=None):
         """
         Search for exactly one element matching a 'where' condition.
 
@@ -267,22 +873,210 @@ class Table(object):
 
         :param id: the condition or ID
         :type id: query, int
+        :param fields: the keys of the fields to return (see :meth:`search`)
+        :type fields: list
 
         :returns: the element or None
         :rtype: dict or None
         """
 
-        if isinstance(id, query):
+        self._db._sync()
+
+        with self._db._stats.timer('get'):
+            if isinstance(id, AndOrMixin):
+                where = id
+
+                for _, el in self._matches(where,
+                                           self._read_for(where, fields),
+                                           lazy=True):
+                    return self._project(el, fields)
+            else:
+                return self._project(self._db._read_element(self.name, id),
+                                     fields)
+
+    def _resolve(self, id, data):
+        """
+        Get the IDs of the elements a condition, a list of IDs or an ID
+        refers to.
+
+        :raises KeyError: if a single ID is given and there is no such
+                          element
+        """
+
+        if isinstance(id, AndOrMixin):
+            # Got a query
             where = id
+            return [i for i, _ in self._matches(where, data)]
+        elif isinstance(id, list):
+            # Got a list of IDs
+            return [i for i in set(id) if i in data]
+        else:
+            # Got an id
+            if id not in data:
+                raise KeyError(id)
+            return [id]
+
+    def _matches(self, where, data, lazy=False):
+        """
+        Iterate over the elements matching a query.
 
-            for el in self.all():
-                if where(el):
-                    return el
+        Only the elements the indexes consider to be candidates are tested
+        (see :meth:`_candidates`).
+
+        :param where: the condition
+        :param data: all elements of the table
+        :type data: dict
+        :param lazy: Whether the caller may stop iterating early. The
+                     elements are then tested while iterating instead of
+                     testing all of them in parallel upfront.
+        :type lazy: bool
+        :returns: an iterator of ``(id, element)`` pairs
+        """
+
+        test = where.compile()
+        ids = self._candidates(where)
+        stats = self._db._stats
+
+        if ids is None:
+            stats.count('full_scans')
         else:
-            return self._read()[id]
+            stats.count('index_scans')
+            stats.count('index_candidates', len(ids))
 
-    def _clear_query_cache(self):
+        if self._columnar and ids is None:
+            if self._columns is None:
+                from tinydb.columnar import ColumnStore
+                self._columns = ColumnStore(data)
+
+            for id, element in self._columns.matches(where):
+                yield id, element
+            return
+
+        if self._processes and not lazy and \
+                len(data if ids is None else ids) >= self.PARALLEL_MIN_SIZE:
+            if ids is None:
+                items = sorted(data.iteritems(), key=itemgetter(0))
+            else:
+                items = [(id, data[id]) for id in sorted(ids) if id in data]
+
+            from tinydb.parallel import parallel_filter
+            matched = parallel_filter(where, items, self._processes)
+
+            if matched is not None:
+                stats.count('parallel_scans')
+
+                for id in matched:
+                    yield id, data[id]
+                return
+
+            # The query can't be passed to the workers, tested here instead
+
+        if ids is None:
+            for id, element in data.iteritems():
+                if test(element):
+                    yield id, element
+        else:
+            for id in ids:
+                if id in data and test(data[id]):
+                    yield id, data[id]
+
+    def _candidates(self, where):
         """
+        Get the IDs of the elements possibly matching a query using the
+        table's indexes.
+
+        :param where: the condition
+        :returns: a set of IDs or None, if all elements have to be tested
+        :rtype: set or None
+        """
+
+        if isinstance(where, query_and):
+            # Conditions on the same indexed field are passed to the index
+            # together, so it can combine them (e.g. into a single range).
+            indexed = {}
+            result = None
+
+            for cond in self._conjunctions(where):
+                if isinstance(cond, query) and cond._key in self._indexes:
+                    indexed.setdefault(cond._key, []).append(cond)
+                    continue
+
+                ids = self._candidates(cond)
+                if ids is not None:
+                    result = ids if result is None else result & ids
+
+            for key, conds in indexed.iteritems():
+                ids = self._indexes[key].lookup(conds)
+                if ids is not None:
+                    result = ids if result is None else result & ids
+
+            return result
+        elif isinstance(where, query_or):
+            ids1 = self._candidates(where._cond_1)
+            ids2 = self._candidates(where._cond_2)
 
+            if ids1 is None or ids2 is None:
+                return None
+            else:
+                return ids1 | ids2
+        elif isinstance(where, query) and where._key in self._indexes:
+            return self._indexes[where._key].lookup([where])
+
+    def _indexed(self, where):
+        """
+        Get the IDs of the elements matching a query if an index can answer
+        the query exactly, i.e. the query is a single comparison on an
+        indexed field.
+
+        :returns: a set of IDs or None
+        :rtype: set or None
+        """
+
+        if isinstance(where, query) and where._key in self._indexes and \
+                where._operator() is not None:
+            return self._indexes[where._key].lookup([where])
+
+    def _conjunctions(self, where):
+        """
+        Get the conditions a tree of ``&`` combined queries consists of.
+        """
+
+        if isinstance(where, query_and):
+            return (self._conjunctions(where._cond_1) +
+                    self._conjunctions(where._cond_2))
+        else:
+            return [where]
+
+    def _index_add(self, id, element):
+        for index in self._indexes.itervalues():
+            index.add(id, element)
+
+    def _index_remove(self, id, element):
+        for index in self._indexes.itervalues():
+            index.remove(id, element)
+
+    def _rebuild_indexes(self, data):
+        for index in self._indexes.itervalues():
+            index.build(data)
+
+    def _clear_indexes(self):
+        for index in self._indexes.itervalues():
+            index.clear()
+
+    def query_cache_info(self):
+        """
+        Get statistics about the query cache.
+
+        See :meth:`tinydb.utils.LRUCache.info`.
+
+        :rtype: dict
+        """
+        return self._queries_cache.info()
+
+    def _clear_query_cache(self):
+        """
+        Forget the cached query results and the columnar copy of the table,
+        as the data has changed.
         """
-        self._queries_cache = {}
+        self._queries_cache.clear()
+        self._columns = None
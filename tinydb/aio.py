@@ -0,0 +1,137 @@
+"""
+An asyncio front-end for TinyDB.
+
+All operations are run by a single worker thread, so neither storage I/O nor
+serialization blocks the event loop, and operations are executed in the
+order they have been issued. Every method returns an awaitable.
+
+On Python 2, ``trollius`` is used instead of asyncio.
+
+>>> db = AsyncTinyDB('db.json')
+>>> await db.insert({'int': 1})
+>>> await db.table('other').search(field('int') == 1)
+"""
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio  # Python 2
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from tinydb import TinyDB
+
+__all__ = ('AsyncTinyDB',)
+
+
+class AsyncTable(object):
+    """
+    Asynchronous access to a single table.
+
+    See :class:`tinydb.Table` for the documentation of the methods.
+    """
+
+    def __init__(self, db, name, options=None):
+        """
+        :param db: The parent database.
+        :type db: AsyncTinyDB
+        :param name: The name of the table.
+        :type name: str
+        :param options: See :meth:`tinydb.TinyDB.table`.
+        :type options: dict
+        """
+        self.name = name
+        self._async_db = db
+        self._options = options or {}
+
+    def all(self, as_dict=False):
+        return self._run('all', as_dict)
+
+    def insert(self, element):
+        return self._run('insert', element)
+
+    def insert_multiple(self, elements):
+        # Consume the iterable on the worker thread too
+        return self._run('insert_multiple', elements)
+
+    def remove(self, id):
+        return self._run('remove', id)
+
+    def update(self, fields, where):
+        return self._run('update', fields, where)
+
+    def purge(self):
+        return self._run('purge')
+
+    def search(self, where, limit=None, offset=0, fields=None):
+        return self._run('search', where, limit, offset, fields)
+
+    def get(self, id, fields=None):
+        return self._run('get', id, fields)
+
+    def count(self, where=None):
+        """
+        Count the elements matching a condition or all elements (instead of
+        ``len()``).
+        """
+        return self._run('count', where)
+
+    def contains(self, where):
+        return self._run('contains', where)
+
+    def _run(self, method, *args):
+        def call():
+            table = self._async_db._sync_db().table(self.name, **self._options)
+            return getattr(table, method)(*args)
+
+        return self._async_db._submit(call)
+
+
+class AsyncTinyDB(AsyncTable):
+    """
+    A TinyDB whose operations don't block the event loop.
+
+    Accepts the same arguments as :class:`tinydb.TinyDB`. Operations on the
+    database itself work on the default table, like with TinyDB.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(AsyncTinyDB, self).__init__(self, '_default')
+
+        # One worker thread keeps the operations in order
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+        # Opening the storage may do I/O already
+        self._db = self._executor.submit(partial(TinyDB, *args, **kwargs))
+
+    def table(self, name='_default', **options):
+        """
+        Get access to a specific table.
+
+        See :meth:`tinydb.TinyDB.table`.
+
+        :rtype: AsyncTable
+        """
+        return AsyncTable(self, name, options)
+
+    def purge_all(self):
+        return self._submit(lambda: self._sync_db().purge_all())
+
+    def close(self):
+        """
+        Wait for all pending operations and stop the worker thread.
+        """
+        return asyncio.get_event_loop().run_in_executor(
+            None, partial(self._executor.shutdown, wait=True))
+
+    def _sync_db(self):
+        """
+        Get the underlying TinyDB. Only to be called by the worker thread.
+
+        :rtype: TinyDB
+        """
+        return self._db.result()
+
+    def _submit(self, func):
+        return asyncio.get_event_loop().run_in_executor(self._executor, func)
@@ -0,0 +1,225 @@
+"""
+A columnar representation of a table evaluating queries with NumPy.
+
+Used by tables opened with ``columnar`` (see :class:`tinydb.Table`). The
+values of every field are stored in arrays, one for numbers and one for
+strings, each with a mask telling which elements have such a value. Queries
+built from comparisons, ``&``, ``|`` and ``~`` are evaluated as vectorized
+operations on these arrays and only the matching elements are looked up.
+
+Everything NumPy can't evaluate with the exact semantics of the row-wise
+test is tested row by row, e.g. regexes, custom tests and comparisons of
+values of different types.
+
+Requires NumPy.
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from tinydb.queries import AndOrMixin, query, query_and, query_or, query_not
+
+try:
+    _INTEGERS = (int, long)
+    _STRINGS = basestring
+except NameError:  # Python 3
+    _INTEGERS = int
+    _STRINGS = str
+
+#: Integers beyond this can't be compared exactly using floats
+_MAX_EXACT_INT = 2 ** 53
+
+_COMPARE = {
+    'eq': lambda values, value: values == value,
+    'ne': lambda values, value: values != value,
+    'lt': lambda values, value: values < value,
+    'le': lambda values, value: values <= value,
+    'gt': lambda values, value: values > value,
+    'ge': lambda values, value: values >= value,
+}
+
+
+def _kind(value):
+    """
+    Get the kind of column a value is stored in (``'numbers'`` or
+    ``'strings'``) or None if it isn't stored in a column.
+    """
+    if isinstance(value, _INTEGERS):  # Includes bools
+        return 'numbers' if abs(value) < _MAX_EXACT_INT else None
+    if isinstance(value, float):
+        return 'numbers'
+    if isinstance(value, _STRINGS):
+        return 'strings'
+
+
+def _array(values, kind):
+    """
+    Convert values to an array, keeping strings as Python objects if NumPy
+    would alter them.
+    """
+    if kind == 'strings':
+        try:
+            if not any(value.endswith('\0') for value in values):
+                # NumPy strips trailing NUL characters
+                return numpy.array(values, dtype=numpy.unicode_)
+        except UnicodeDecodeError:
+            pass  # Non-ASCII byte strings
+
+        return numpy.array(values, dtype=object)
+
+    return numpy.array(values)
+
+
+def _exact(values, value):
+    """
+    Check whether NumPy compares a value to an array the way Python does.
+    """
+    if values.dtype.kind != 'U':
+        return True  # Numbers or Python objects
+
+    if value.endswith('\0'):
+        return False  # NumPy strips trailing NUL characters
+
+    try:
+        numpy.unicode_(value)
+    except UnicodeDecodeError:
+        return False  # Non-ASCII byte strings
+
+    return True
+
+
+class _Column(object):
+    """
+    The values of one field.
+    """
+
+    def __init__(self, size):
+        self.present = numpy.zeros(size, dtype=bool)
+        self.masks = {}  # kind -> the rows having a value of this kind
+        self.values = {}  # kind -> array of values (garbage in other rows)
+
+
+class ColumnStore(object):
+    """
+    The elements of a table stored as columns.
+
+    >>> store = ColumnStore(table.all(as_dict=True))
+    >>> store.matches((field('int') > 5) & ~(field('char') == 'a'))
+    [(3, {'int': 6, 'char': 'b'})]
+    """
+
+    def __init__(self, elements):
+        """
+        :param elements: all elements of the table
+        :type elements: dict
+        """
+        if numpy is None:
+            raise ImportError('Columnar tables require NumPy')
+
+        self.ids = list(elements.keys())
+        self.elements = list(elements.values())
+        self.columns = {}
+
+        size = len(self.elements)
+        values = {}  # key -> kind -> ([row], [value])
+
+        for row, element in enumerate(self.elements):
+            for key, value in element.items():
+                by_kind = values.setdefault(key, {})
+
+                rows, kind_values = by_kind.setdefault(_kind(value), ([], []))
+                rows.append(row)
+                kind_values.append(value)
+
+        for key, by_kind in values.items():
+            column = self.columns[key] = _Column(size)
+
+            for kind, (rows, kind_values) in by_kind.items():
+                column.present[rows] = True
+
+                if kind is None:
+                    continue
+
+                mask = numpy.zeros(size, dtype=bool)
+                mask[rows] = True
+
+                array = _array(kind_values, kind)
+                full = numpy.zeros(size, dtype=array.dtype)
+                full[rows] = array
+
+                column.masks[kind] = mask
+                column.values[kind] = full
+
+    def __len__(self):
+        return len(self.ids)
+
+    def matches(self, where):
+        """
+        Get the elements matching a query.
+
+        :param where: the condition
+        :returns: ``(id, element)`` pairs
+        :rtype: list
+        """
+        return [(self.ids[row], self.elements[row])
+                for row in numpy.flatnonzero(self.evaluate(where))]
+
+    def evaluate(self, where):
+        """
+        Evaluate a query for all elements.
+
+        :param where: the condition
+        :returns: an array telling which elements match
+        :rtype: numpy.ndarray
+        """
+        if isinstance(where, query_and):
+            return self.evaluate(where._cond_1) & self.evaluate(where._cond_2)
+        elif isinstance(where, query_or):
+            return self.evaluate(where._cond_1) | self.evaluate(where._cond_2)
+        elif isinstance(where, query_not):
+            return ~self.evaluate(where._cond)
+        elif isinstance(where, query):
+            return self._compare(where)
+        else:
+            # Regexes, custom tests or other callables
+            return self._test(where, numpy.ones(len(self), dtype=bool))
+
+    def _compare(self, where):
+        column = self.columns.get(where._key)
+        if column is None:
+            return numpy.zeros(len(self), dtype=bool)
+
+        operator = where._operator()
+        if operator is None:
+            return column.present.copy()  # Tests for the key's existence
+
+        name, value = operator
+        kind = _kind(value)
+
+        if kind in column.masks and _exact(column.values[kind], value):
+            result = column.masks[kind] & _COMPARE[name](column.values[kind],
+                                                         value)
+            untested = column.present & ~column.masks[kind]
+        else:
+            result = numpy.zeros(len(self), dtype=bool)
+            untested = column.present
+
+        if untested.any():
+            # Values of other types are compared the way Python does
+            result |= self._test(where, untested)
+
+        return result
+
+    def _test(self, where, rows):
+        """
+        Test the given rows row by row.
+        """
+        test = where.compile() if isinstance(where, AndOrMixin) else where
+        result = numpy.zeros(len(self), dtype=bool)
+
+        for row in numpy.flatnonzero(rows):
+            result[row] = bool(test(self.elements[row]))
+
+        return result
@@ -0,0 +1,255 @@
+"""
+Indexes speeding up queries on single fields of a table.
+
+An index maps the values of one field to the IDs of the elements having
+them. Tables keep their indexes up to date on every modification and ask
+them for the IDs of the elements that possibly match a query (see
+:meth:`tinydb.Table.create_index`).
+"""
+
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
+
+
+class HashIndex(object):
+    """
+    An index answering equality queries (``field('key') == value``).
+
+    Elements missing the field or having an unhashable value (e.g. a list)
+    are not indexed. They can't be equal to a hashable value anyway.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self._ids = {}
+
+    def build(self, elements):
+        """
+        Rebuild the index from scratch.
+
+        :param elements: all elements of the table
+        :type elements: dict
+        """
+        self._ids = {}
+
+        for id, element in elements.iteritems():
+            self.add(id, element)
+
+    def add(self, id, element):
+        """
+        Add an element to the index.
+        """
+        if self.key not in element:
+            return
+
+        try:
+            self._ids.setdefault(element[self.key], set()).add(id)
+        except TypeError:
+            pass  # Unhashable value
+
+    def add_many(self, items):
+        """
+        Add multiple elements to the index.
+
+        :param items: ``(id, element)`` pairs
+        :type items: list
+        """
+        for id, element in items:
+            self.add(id, element)
+
+    def remove(self, id, element):
+        """
+        Remove an element from the index.
+        """
+        if self.key not in element:
+            return
+
+        try:
+            ids = self._ids[element[self.key]]
+        except (KeyError, TypeError):
+            return
+
+        ids.discard(id)
+        if not ids:
+            del self._ids[element[self.key]]
+
+    def clear(self):
+        """
+        Remove all elements from the index.
+        """
+        self._ids = {}
+
+    def lookup(self, conditions):
+        """
+        Get the IDs of all elements possibly matching all of the given
+        queries on this index's field.
+
+        :param conditions: the queries to answer
+        :type conditions: list of tinydb.queries.query
+        :returns: a set of IDs or None, if the queries can't be answered by
+                  this index
+        :rtype: set or None
+        """
+        result = None
+
+        for where in conditions:
+            operator = where._operator()
+            if operator is None or operator[0] != 'eq':
+                continue
+
+            try:
+                ids = self._ids.get(operator[1], ())
+            except TypeError:
+                continue  # Unhashable value, can't be answered
+
+            if result is None:
+                result = set(ids)
+            else:
+                result &= ids
+
+        return result
+
+
+class SortedIndex(object):
+    """
+    An index answering equality and range queries (``==``, ``<``, ``<=``,
+    ``>``, ``>=``).
+
+    The values are kept sorted, so all conditions on the field are combined
+    into one range that is looked up using binary search, e.g.
+    ``(field('ts') >= a) & (field('ts') < b)`` results in a single slice.
+    """
+
+    #: Adding at least this many elements at once merges them into the index
+    #: instead of inserting them one by one, as every insertion moves all
+    #: following values.
+    MERGE_MIN_SIZE = 100
+
+    def __init__(self, key):
+        self.key = key
+        self._values = []
+        self._ids = []  # The IDs belonging to the values in ``_values``
+
+    def build(self, elements):
+        """
+        Rebuild the index from scratch.
+
+        :param elements: all elements of the table
+        :type elements: dict
+        """
+        pairs = sorted([(element[self.key], id)
+                        for id, element in elements.iteritems()
+                        if self.key in element], key=itemgetter(0))
+
+        self._values = [value for value, _ in pairs]
+        self._ids = [id for _, id in pairs]
+
+    def add(self, id, element):
+        """
+        Add an element to the index.
+        """
+        if self.key not in element:
+            return
+
+        value = element[self.key]
+        i = bisect_right(self._values, value)
+
+        self._values.insert(i, value)
+        self._ids.insert(i, id)
+
+    def add_many(self, items):
+        """
+        Add multiple elements to the index.
+
+        :param items: ``(id, element)`` pairs
+        :type items: list
+        """
+        if len(items) < self.MERGE_MIN_SIZE:
+            for id, element in items:
+                self.add(id, element)
+            return
+
+        pairs = sorted([(element[self.key], id) for id, element in items
+                        if self.key in element], key=itemgetter(0))
+
+        # Sorting is stable and finds the two sorted runs, so this merges them
+        # in linear time, keeping new values after equal existing ones
+        pairs = sorted(zip(self._values, self._ids) + pairs,
+                       key=itemgetter(0))
+
+        self._values = [value for value, _ in pairs]
+        self._ids = [id for _, id in pairs]
+
+    def remove(self, id, element):
+        """
+        Remove an element from the index.
+        """
+        if self.key not in element:
+            return
+
+        value = element[self.key]
+
+        for i in xrange(bisect_left(self._values, value),
+                        bisect_right(self._values, value)):
+            if self._ids[i] == id:
+                del self._values[i]
+                del self._ids[i]
+                return
+
+    def clear(self):
+        """
+        Remove all elements from the index.
+        """
+        self._values = []
+        self._ids = []
+
+    def lookup(self, conditions):
+        """
+        Get the IDs of all elements possibly matching all of the given
+        queries on this index's field.
+
+        :param conditions: the queries to answer
+        :type conditions: list of tinydb.queries.query
+        :returns: a set of IDs or None, if the queries can't be answered by
+                  this index
+        :rtype: set or None
+        """
+        lower = upper = None  # (value, inclusive)
+
+        for where in conditions:
+            operator = where._operator()
+            if operator is None:
+                continue
+
+            name, value = operator
+
+            if name in ('eq', 'gt', 'ge'):
+                bound = (value, name != 'gt')
+                if lower is None or bound[0] > lower[0] or \
+                        (bound[0] == lower[0] and not bound[1]):
+                    lower = bound
+
+            if name in ('eq', 'lt', 'le'):
+                bound = (value, name != 'lt')
+                if upper is None or bound[0] < upper[0] or \
+                        (bound[0] == upper[0] and not bound[1]):
+                    upper = bound
+
+        if lower is None and upper is None:
+            return None
+
+        start, end = 0, len(self._values)
+
+        if lower is not None:
+            if lower[1]:
+                start = bisect_left(self._values, lower[0])
+            else:
+                start = bisect_right(self._values, lower[0])
+
+        if upper is not None:
+            if upper[1]:
+                end = bisect_right(self._values, upper[0])
+            else:
+                end = bisect_left(self._values, upper[0])
+
+        return set(self._ids[start:end])
@@ -1,6 +1,18 @@
-from threading import RLock
+import bz2
+import zlib
+from contextlib import contextmanager
+from threading import RLock, local
 
-from tinydb.storages import Storage
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+from tinydb.storages import Storage, _finished
+from tinydb.utils import ReadWriteLock
 
 
 class Middleware(Storage):
@@ -57,6 +69,20 @@ class Middleware(Storage):
 
         return self
 
+    def attach_stats(self, stats):
+        self.stats = stats
+        self.storage.attach_stats(stats)
+
+    def transaction(self):
+        return self.storage.transaction()
+
+    def version(self):
+        return self.storage.version()
+
+    def begin_write_table(self, name, values):
+        self.write_table(name, values)
+        return _finished
+
     def __getattr__(self, name):
         """
         Forward all unknown attribute calls to the underlying storage.
@@ -68,9 +94,14 @@ class CachingMiddleware(Middleware):
     """
     Add some caching to TinyDB.
 
-    This Middleware aims to improve the performance of TinyDB by writing only
-    the last DB state every ``WRITE_CACHE_SIZE`` time and reading always from
-    cache.
+    This Middleware aims to improve the performance of TinyDB by reading the
+    data from the underlying storage only once, reading always from cache and
+    writing only the last DB state every ``WRITE_CACHE_SIZE`` time.
+
+    The cache remembers which tables have been modified, so if the storage
+    supports writing single tables (see
+    :attr:`~tinydb.storages.Storage.supports_table_writes`), only the
+    modified tables are written on :meth:`flush`.
     """
 
     WRITE_CACHE_SIZE = 1000
@@ -78,6 +109,8 @@ class CachingMiddleware(Middleware):
     def __init__(self, storage_cls):
         self.cache = None
         self._cache_modified_count = 0
+        self._dirty_tables = set()
+        self._dirty_all = False
         self._storage_cls = storage_cls
 
     def __del__(self):
@@ -86,36 +119,298 @@ class CachingMiddleware(Middleware):
         """
         self.flush()
 
+    @property
+    def supports_concurrent_reads(self):
+        return self.storage.supports_concurrent_reads
+
     def write(self, data):
         self.cache = data
-        self._cache_modified_count += 1
-
-        if self._cache_modified_count >= self.WRITE_CACHE_SIZE:
-            self.flush()
+        self._dirty_all = True
+        self._modified()
 
     def read(self):
+        if self.cache is None:
+            self.cache = self.storage.read()
+
         return self.cache
 
+    def write_table(self, name, values):
+        try:
+            cache = self.read()
+        except ValueError:
+            cache = self.cache = {}
+
+        cache[name] = values
+        self._dirty_tables.add(name)
+        self._modified()
+
     def flush(self):
-        self.storage.write(self.cache)
+        """
+        Write the modified data to the underlying storage.
+        """
+        if self._dirty_all or (self._dirty_tables and
+                               not self.storage.supports_table_writes):
+            self.storage.write(self.cache)
+        elif self._dirty_tables:
+            self.storage.write_tables(dict([(name, self.cache[name])
+                                            for name in self._dirty_tables]))
+
+        self._dirty_tables = set()
+        self._dirty_all = False
         self._cache_modified_count = 0
 
+    def _modified(self):
+        self._cache_modified_count += 1
+
+        if self._cache_modified_count >= self.WRITE_CACHE_SIZE:
+            self.flush()
+
 
 class ConcurrencyMiddleware(Middleware):
     """
     Makes TinyDB working with multithreading.
 
     Uses a lock so write/read operations are virtually atomic.
+
+    By default, a single lock serializes all reads and writes. With
+    ``read_write_lock``, a :class:`~tinydb.utils.ReadWriteLock` is used
+    instead, so multiple threads can read at the same time while writes
+    still are exclusive. This requires a storage supporting concurrent reads
+    (see :attr:`~tinydb.storages.Storage.supports_concurrent_reads`).
+
+    The lock is released before waiting for a write to be finished (see
+    :meth:`~tinydb.storages.Storage.begin_write`), so the storage can commit
+    the writes of multiple threads together.
     """
 
-    def __init__(self, storage_cls):
-        self.lock = RLock()
+    def __init__(self, storage_cls, read_write_lock=False):
+        if read_write_lock:
+            self.lock = ReadWriteLock()
+            self._read_lock = self.lock.reader
+            self._write_lock = self.lock.writer
+        else:
+            self.lock = RLock()
+            self._read_lock = self._write_lock = self.lock
+
         self._storage_cls = storage_cls
+        self._read_write_lock = read_write_lock
+        self._unfinished = local()  # The writes started in a transaction
+
+    def __call__(self, *args, **kwargs):
+        super(ConcurrencyMiddleware, self).__call__(*args, **kwargs)
+
+        if (self._read_write_lock and
+                not self.storage.supports_concurrent_reads):
+            raise ValueError('{} doesn\'t support concurrent reads, use '
+                             'read_write_lock=False'.format(
+                                 type(self.storage).__name__))
+
+        return self
+
+    @property
+    def supports_table_writes(self):
+        return self.storage.supports_table_writes
+
+    @property
+    def supports_field_reads(self):
+        return self.storage.supports_field_reads
+
+    @contextmanager
+    def transaction(self):
+        if getattr(self._unfinished, 'writes', None) is not None:
+            with self._write_lock:
+                yield  # Nested
+            return
+
+        writes = self._unfinished.writes = []
+        try:
+            with self._write_lock:
+                with self.storage.transaction():
+                    yield
+        finally:
+            # The writes are finished once the lock has been released
+            self._unfinished.writes = None
+            for finish in writes:
+                finish()
 
     def write(self, data):
-        with self.lock:
-            self.storage.write(data)
+        self._finish(self.begin_write(data))
 
     def read(self):
-        with self.lock:
+        with self._read_lock:
             return self.storage.read()
+
+    def write_table(self, name, values):
+        self._finish(self.begin_write_table(name, values))
+
+    def read_table(self, name, fields=None):
+        with self._read_lock:
+            if fields is None:
+                return self.storage.read_table(name)
+
+            return self.storage.read_table(name, fields)
+
+    def write_tables(self, tables):
+        with self._write_lock:
+            self.storage.write_tables(tables)
+
+    def begin_write(self, data):
+        with self._write_lock:
+            return self.storage.begin_write(data)
+
+    def begin_write_table(self, name, values):
+        with self._write_lock:
+            return self.storage.begin_write_table(name, values)
+
+    def _finish(self, finish):
+        """
+        Finish a write, or after the current transaction if there is one.
+        """
+        writes = getattr(self._unfinished, 'writes', None)
+        if writes is None:
+            finish()
+        else:
+            writes.append(finish)
+
+
+class _CompressedFile(object):
+    """
+    A file compressing everything written to it and decompressing everything
+    read from it.
+
+    Data is passed through the (de)compressor in chunks of ``CHUNK_SIZE``
+    bytes. As long as the storage writes and reads in pieces, there's never
+    a complete uncompressed copy of the data next to the compressed one.
+    Implements the subset of file methods used by the storages: a write is
+    started with ``seek(0)`` and finished by ``flush()`` or ``truncate()``.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, raw, compressor, decompressor):
+        self._raw = raw
+        self._new_compressor = compressor
+        self._new_decompressor = decompressor
+        self._compressor = None
+
+    def seek(self, offset):
+        self._finish()
+        self._raw.seek(offset)
+
+    def write(self, data):
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+
+        if self._compressor is None:
+            self._compressor = self._new_compressor()
+
+        for start in range(0, len(data), self.CHUNK_SIZE):
+            chunk = data[start:start + self.CHUNK_SIZE]
+            self._raw.write(self._compressor.compress(chunk))
+
+    def read(self):
+        self._finish()
+
+        decompressor = self._new_decompressor()
+        chunks = []
+
+        while True:
+            chunk = self._raw.read(self.CHUNK_SIZE)
+            if not chunk:
+                break
+
+            chunks.append(decompressor.decompress(chunk))
+
+        return b''.join(chunks)
+
+    def truncate(self):
+        self._finish()
+        self._raw.truncate()
+
+    def flush(self):
+        self._finish()
+        self._raw.flush()
+
+    def fileno(self):
+        return self._raw.fileno()
+
+    def close(self):
+        self._finish()
+        self._raw.close()
+
+    def _finish(self):
+        """
+        Write the end of the compressed stream if there is a pending write.
+        """
+        if self._compressor is not None:
+            self._raw.write(self._compressor.flush())
+            self._compressor = None
+
+
+class CompressionMiddleware(Middleware):
+    """
+    Compress the data stored on disk.
+
+    Works with storages keeping the data in a single file, i.e.
+    :class:`~tinydb.storages.JSONStorage` and the
+    :class:`~tinydb.storages.BinaryStorage` subclasses:
+
+    >>> db = TinyDB('db.json.gz', storage=CompressionMiddleware(JSONStorage))
+
+    Supported codecs are ``'zlib'`` (producing gzip files), ``'bz2'`` and
+    ``'lzma'`` (Python 3.3+ or ``backports.lzma``). The data is compressed
+    and decompressed in chunks while being written and read. Only
+    :class:`~tinydb.storages.JSONStorage` streams its data though (except
+    for durable writes): the binary storages encode all the data before
+    writing it, so its uncompressed copy is still held in memory.
+    """
+
+    DEFAULT_LEVELS = {'zlib': 6, 'bz2': 9, 'lzma': 6}
+
+    def __init__(self, storage_cls, codec='zlib', level=None):
+        if codec not in self.DEFAULT_LEVELS:
+            raise ValueError('Unknown codec: {}'.format(codec))
+        if codec == 'lzma' and lzma is None:
+            raise ImportError('The lzma codec requires Python 3.3+ or '
+                              'backports.lzma')
+
+        self.codec = codec
+        self.level = self.DEFAULT_LEVELS[codec] if level is None else level
+        self._storage_cls = storage_cls
+
+    def __call__(self, *args, **kwargs):
+        kwargs['opener'] = self._open
+        return super(CompressionMiddleware, self).__call__(*args, **kwargs)
+
+    @property
+    def supports_concurrent_reads(self):
+        return self.storage.supports_concurrent_reads
+
+    def write(self, data):
+        self.storage.write(data)
+
+    def read(self):
+        return self.storage.read()
+
+    def _open(self, path, mode):
+        # The raw file is always binary, the mode the storage asked for
+        # applies to the uncompressed data.
+        raw_mode = 'rb' if mode in ('r', 'rb') else 'r+b'
+        return _CompressedFile(open(path, raw_mode), *self._codec())
+
+    def _codec(self):
+        """
+        Get factories for the compressor and decompressor of the codec.
+        """
+        level = self.level
+
+        if self.codec == 'zlib':
+            # wbits = 16 + MAX_WBITS: use a gzip header and trailer
+            return (lambda: zlib.compressobj(level, zlib.DEFLATED,
+                                             16 + zlib.MAX_WBITS),
+                    lambda: zlib.decompressobj(16 + zlib.MAX_WBITS))
+        elif self.codec == 'bz2':
+            return (lambda: bz2.BZ2Compressor(level), bz2.BZ2Decompressor)
+        else:
+            return (lambda: lzma.LZMACompressor(preset=level),
+                    lzma.LZMADecompressor)
@@ -0,0 +1,104 @@
+"""
+Testing elements against a query on multiple processes.
+
+Used by tables opened with ``processes`` (see :class:`tinydb.Table`). The
+elements are split into chunks which are tested by a pool of worker
+processes. Where processes are started by forking, the workers inherit the
+query and the elements instead of receiving them pickled, so only the
+matching IDs have to be transferred. As the workers have to inherit them, a
+new pool of workers is started for every scan.
+"""
+
+import multiprocessing
+import os
+from threading import Lock
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+#: The query and the elements being tested, inherited by forked workers
+_where = None
+_items = None
+#: Held while these are in use, one scan at a time can use them
+_items_lock = Lock()
+
+
+def _uses_fork():
+    if os.name != 'posix':
+        return False
+
+    try:
+        return multiprocessing.get_start_method() == 'fork'
+    except AttributeError:
+        return True  # Python 2 always forks on POSIX
+
+
+def _test_chunk(args):
+    """
+    Get the IDs of the matching elements of one chunk.
+    """
+    where, start, end, items = args
+
+    if items is None:
+        where, items = _where, _items[start:end]
+
+    test = where.compile()
+    return [id for id, element in items if test(element)]
+
+
+def parallel_filter(where, items, processes, chunks_per_process=4):
+    """
+    Get the IDs of the elements matching a query.
+
+    Unless the workers are forked, the query has to be picklable, i.e.
+    functions passed to :meth:`tinydb.queries.query.test` have to be defined
+    at module level.
+
+    :param where: the condition
+    :param items: ``(id, element)`` pairs
+    :type items: list
+    :param processes: the number of worker processes
+    :type processes: int
+    :param chunks_per_process: into how many chunks per process to split the
+                               elements, more chunks balance the load better
+    :type chunks_per_process: int
+    :returns: the IDs of the matching elements in the order of ``items``,
+              or None if the query can't be passed to the workers
+    :rtype: list or None
+    """
+    global _where, _items
+
+    size = -(-len(items) // (processes * chunks_per_process)) or 1
+    bounds = [(start, min(start + size, len(items)))
+              for start in range(0, len(items), size)]
+
+    if _uses_fork():
+        chunks = [(None, start, end, None) for start, end in bounds]
+
+        with _items_lock:
+            _where, _items = where, items
+            try:
+                results = _map(chunks, processes)
+            finally:
+                _where = _items = None
+    else:
+        try:
+            pickle.dumps(where, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return None  # E.g. a lambda passed to test()
+
+        chunks = [(where, start, end, items[start:end])
+                  for start, end in bounds]
+        results = _map(chunks, processes)
+
+    return [id for ids in results for id in ids]
+
+
+def _map(chunks, processes):
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(_test_chunk, chunks)
+    finally:
+        pool.terminate()
@@ -3,13 +3,109 @@ import re
 __all__ = 'has'
 
 
+#: The Python operators belonging to the names used by :meth:`query._operator`
+OPERATORS = {'eq': '==', 'ne': '!=', 'lt': '<', 'le': '<=', 'gt': '>',
+             'ge': '>='}
+
+#: Query trees nested deeper than this (after flattening chains of ``&`` and
+#: ``|``) are compiled into nested functions instead of one expression, as
+#: Python's parser can't handle deeply nested expressions.
+MAX_EXPRESSION_DEPTH = 30
+
+
+def _bind(namespace, value):
+    """
+    Make a value available to generated code.
+
+    :returns: the name the value can be accessed by
+    """
+    name = '_v{}'.format(len(namespace))
+    namespace[name] = value
+    return name
+
+
+def _fields(cond):
+    """
+    Get the keys a condition accesses or None if they're unknown.
+    """
+    if isinstance(cond, AndOrMixin):
+        return cond._fields()
+
+
+def _operands(cond, cls):
+    """
+    Get the operands of a chain of ``cls`` nodes, nested on either side
+    (e.g. ``a | (b | c)`` results in ``[a, b, c]``).
+    """
+    operands = []
+    stack = [cond]
+
+    while stack:
+        node = stack.pop()
+
+        if isinstance(node, cls):
+            stack.append(node._cond_2)
+            stack.append(node._cond_1)
+        else:
+            operands.append(node)
+
+    return operands
+
+
+def _depth(cond):
+    """
+    Get the nesting depth of the expression a condition is compiled into.
+    """
+    if isinstance(cond, (query_and, query_or)):
+        return 1 + max([_depth(operand)
+                        for operand in _operands(cond, type(cond))])
+    elif isinstance(cond, query_not):
+        return 1 + _depth(cond._cond)
+    else:
+        return 1
+
+
+def _compose(cond):
+    """
+    Compile a condition into nested functions (see
+    :data:`MAX_EXPRESSION_DEPTH`).
+    """
+    if isinstance(cond, (query_and, query_or)):
+        tests = [_compose(operand) for operand in _operands(cond, type(cond))]
+        combine = all if isinstance(cond, query_and) else any
+
+        return lambda element: combine(test(element) for test in tests)
+    elif isinstance(cond, query_not):
+        test = _compose(cond._cond)
+        return lambda element: not test(element)
+    elif isinstance(cond, AndOrMixin):
+        return cond.compile()
+    else:
+        return cond
+
+
+def _source(cond, namespace):
+    """
+    Get the source of an expression testing ``element`` against a condition.
+    """
+    if isinstance(cond, AndOrMixin):
+        return cond._source(namespace)
+    else:
+        # Not a query but some other callable
+        return '{}(element)'.format(_bind(namespace, cond))
+
+
 class AndOrMixin(object):
     """
     A mixin providing methods calls '&' and '|'.
 
     All queries can be combined with '&' and '|'. Thus, we provide a mixin
     here to prevent repeating this code all the time.
+
+    In addition, it takes care of running the query: The query tree is
+    compiled into a single function (see :meth:`compile`).
     """
+
     def __or__(self, other):
         """
         Combines this query and another with logical or.
@@ -34,6 +130,49 @@ class AndOrMixin(object):
         """
         return query_and(self, other)
 
+    def __call__(self, element):
+        """
+        Run the test on the element.
+
+        :param element: The dict that we will run our tests against.
+        :type element: dict
+        """
+        return self.compile()(element)
+
+    def compile(self):
+        """
+        Compile the query into a single function testing an element.
+
+        The whole query tree is turned into one Python expression, so running
+        the query doesn't need a function call per node or any lookup which
+        comparison to run. The function is cached, so queries must not be
+        modified after they have been run the first time.
+
+        >>> test = ((field('f1') == 5) & (field('f2') != 2)).compile()
+        >>> test({'f1': 5, 'f2': 3})
+        True
+
+        :returns: a function accepting an element and returning whether
+                  it matches
+        """
+        try:
+            return self.__dict__['_compiled']
+        except KeyError:
+            if _depth(self) > MAX_EXPRESSION_DEPTH:
+                self._compiled = _compose(self)
+            else:
+                namespace = {}
+                source = 'lambda element: ' + _source(self, namespace)
+                self._compiled = eval(source, namespace)
+
+            return self._compiled
+
+    def __getstate__(self):
+        # The compiled function can't be pickled, it's compiled again
+        state = self.__dict__.copy()
+        state.pop('_compiled', None)
+        return state
+
 
 class query(AndOrMixin):
     """
@@ -154,51 +293,42 @@ class query(AndOrMixin):
         """
         return query_not(self)
 
-    def __call__(self, element):
-        """
-        Run the test on the element.
-
-        :param element: The dict that we will run our tests against.
-        :type element: dict
+    def _operator(self):
         """
-        if self._key not in element:
-            return False
+        Get the comparison this query runs.
 
-        try:
-            return element[self._key] == self._value_eq
-        except AttributeError:
-            pass
+        If multiple comparisons have been set, the one ``__call__`` uses
+        wins.
 
-        try:
-            return element[self._key] != self._value_ne
-        except AttributeError:
-            pass
+        :returns: the operator's name (``'eq'``, ``'ne'``, ``'lt'``, ``'le'``,
+                  ``'gt'`` or ``'ge'``) and the value to compare with or
+                  None, if the query only tests for the key's existence
+        :rtype: tuple or None
+        """
+        for name in ('eq', 'ne', 'lt', 'le', 'gt', 'ge'):
+            try:
+                return name, getattr(self, '_value_' + name)
+            except AttributeError:
+                pass
 
-        try:
-            return element[self._key] < self._value_lt
-        except AttributeError:
-            pass
+    def _fields(self):
+        return set([self._key])
 
-        try:
-            return element[self._key] <= self._value_le
-        except AttributeError:
-            pass
+    def _source(self, namespace):
+        key = _bind(namespace, self._key)
+        operator = self._operator()
 
-        try:
-            return element[self._key] > self._value_gt
-        except AttributeError:
-            pass
+        if operator is None:
+            return '({} in element)'.format(key)
 
-        try:
-            return element[self._key] >= self._value_ge
-        except AttributeError:
-            pass
-
-        return True  # _key exists in element (see above)
+        name, value = operator
+        return '({0} in element and element[{0}] {1} {2})'.format(
+            key, OPERATORS[name], _bind(namespace, value))
 
     def _update_repr(self, operator, value):
         """ Update the current test's ``repr``. """
         self._repr = '\'{}\' {} {}'.format(self._key, operator, value)
+        self.__dict__.pop('_compiled', None)  # The test has changed
 
     def __repr__(self):
         return self._repr
@@ -218,18 +348,16 @@ class query_not(AndOrMixin):
     """
     def __init__(self, cond):
         self._cond = cond
+        self._repr = 'not ({})'.format(cond)
 
-    def __call__(self, element):
-        """
-        Run the test on the element.
+    def _fields(self):
+        return _fields(self._cond)
 
-        :param element: The dict that we will run our tests against.
-        :type element: dict
-        """
-        return not self._cond(element)
+    def _source(self, namespace):
+        return '(not {})'.format(_source(self._cond, namespace))
 
     def __repr__(self):
-        return 'not ({})'.format(self._cond)
+        return self._repr
 
 
 class query_or(AndOrMixin):
@@ -239,15 +367,24 @@ class query_or(AndOrMixin):
     def __init__(self, where1, where2):
         self._cond_1 = where1
         self._cond_2 = where2
+        self._repr = '({}) or ({})'.format(where1, where2)
 
-    def __call__(self, element):
-        """
-        See :meth:`query.__call__`.
-        """
-        return self._cond_1(element) or self._cond_2(element)
+    def _fields(self):
+        fields1 = _fields(self._cond_1)
+        fields2 = _fields(self._cond_2)
+
+        if fields1 is not None and fields2 is not None:
+            return fields1 | fields2
+
+    def _source(self, namespace):
+        # Chains like ``a | (b | c)`` become a flat ``a or b or c``
+        return '({})'.format(' or '.join([
+            _source(operand, namespace)
+            for operand in _operands(self, query_or)
+        ]))
 
     def __repr__(self):
-        return '({}) or ({})'.format(self._cond_1, self._cond_2)
+        return self._repr
 
 
 class query_and(AndOrMixin):
@@ -257,15 +394,24 @@ class query_and(AndOrMixin):
     def __init__(self, where1, where2):
         self._cond_1 = where1
         self._cond_2 = where2
+        self._repr = '({}) and ({})'.format(where1, where2)
 
-    def __call__(self, element):
-        """
-        See :meth:`query.__call__`.
-        """
-        return self._cond_1(element) and self._cond_2(element)
+    def _fields(self):
+        fields1 = _fields(self._cond_1)
+        fields2 = _fields(self._cond_2)
+
+        if fields1 is not None and fields2 is not None:
+            return fields1 | fields2
+
+    def _source(self, namespace):
+        # Chains like ``a & (b & c)`` become a flat ``a and b and c``
+        return '({})'.format(' and '.join([
+            _source(operand, namespace)
+            for operand in _operands(self, query_and)
+        ]))
 
     def __repr__(self):
-        return '({}) and ({})'.format(self._cond_1, self._cond_2)
+        return self._repr
 
 
 class query_regex(AndOrMixin):
@@ -276,12 +422,13 @@ class query_regex(AndOrMixin):
         self.regex = regex
         self._key = key
 
-    def __call__(self, element):
-        """
-        See :meth:`query.__call__`.
-        """
-        return bool(self._key in element
-                    and re.match(self.regex, element[self._key]))
+    def _fields(self):
+        return set([self._key])
+
+    def _source(self, namespace):
+        return '({0} in element and {1}(element[{0}]) is not None)'.format(
+            _bind(namespace, self._key),
+            _bind(namespace, re.compile(self.regex).match))
 
     def __repr__(self):
         return '\'{}\' ~= {} '.format(self._key, self.regex)
@@ -296,11 +443,12 @@ class query_custom(AndOrMixin):
         self.test = test
         self._key = key
 
-    def __call__(self, element):
-        """
-        See :meth:`query.__call__`.
-        """
-        return self._key in element and self.test(element[self._key])
+    def _fields(self):
+        return set([self._key])
+
+    def _source(self, namespace):
+        return '({0} in element and {1}(element[{0}]))'.format(
+            _bind(namespace, self._key), _bind(namespace, self.test))
 
     def __repr__(self):
         return '\'{}\'.test({})'.format(self._key, self.test)
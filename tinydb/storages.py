@@ -1,18 +1,160 @@
 from abc import ABCMeta, abstractmethod
+from contextlib import closing, contextmanager
 
+import errno
+import marshal
+import mmap
 import os
+import re
+import stat
+import tempfile
+import time
+from functools import partial
+from threading import Condition, RLock, current_thread
 
 try:
     import ujson as json
 except ImportError:
     import json
 
+try:
+    from urllib import quote, unquote
+except ImportError:
+    from urllib.parse import quote, unquote
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Not available on Windows
+
 
 def touch(fname, times=None):
     with file(fname, 'a'):
         os.utime(fname, times)
 
 
+def _replace(src, dst):
+    """
+    Atomically rename ``src`` to ``dst``, replacing ``dst``.
+    """
+    getattr(os, 'replace', os.rename)(src, dst)
+
+
+def _fsync_directory(path):
+    """
+    Make sure a rename in the directory has been written to disk.
+    """
+    if os.name != 'posix':
+        return  # Directories can't be opened on Windows
+
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+_WHITESPACE = re.compile(br'\s*')
+_STRING = re.compile(br'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+# Everything up to the next bracket outside of strings
+_UNTIL_BRACKET = re.compile(br'(?:[^"{}\[\]]+|"[^"\\]*(?:\\.[^"\\]*)*")*',
+                            re.DOTALL)
+_SCALAR_END = re.compile(br'[\s,}\]]')
+
+
+def _skip_whitespace(buf, pos):
+    return _WHITESPACE.match(buf, pos).end()
+
+
+def _skip_value(buf, pos):
+    """
+    Get the end of the JSON value starting at ``pos`` without decoding it.
+    """
+    char = buf[pos:pos + 1]
+
+    if char == b'"':
+        return _STRING.match(buf, pos + 1).end()
+
+    if char not in (b'{', b'['):
+        match = _SCALAR_END.search(buf, pos)
+        return match.start() if match else len(buf)
+
+    depth = 0
+
+    while True:
+        # Skips strings and everything else between brackets in one go
+        pos = _UNTIL_BRACKET.match(buf, pos).end()
+        char = buf[pos:pos + 1]
+        pos += 1
+
+        if char in (b'{', b'['):
+            depth += 1
+        elif char in (b'}', b']'):
+            depth -= 1
+            if depth == 0:
+                return pos
+        else:
+            raise ValueError('Unterminated JSON value')
+
+
+def _scan_object(buf, pos):
+    """
+    Find the members of the JSON object starting at ``pos`` without decoding
+    their values.
+
+    :returns: a list of ``(key, start, end)`` tuples with the offsets of the
+              members' values
+    """
+    return list(_iter_object(buf, pos))
+
+
+def _iter_object(buf, pos):
+    """
+    Like :func:`_scan_object`, but finds the members one at a time.
+    """
+    pos = _skip_whitespace(buf, pos)
+    if buf[pos:pos + 1] != b'{':
+        raise ValueError('Expected a JSON object at {}'.format(pos))
+
+    pos = _skip_whitespace(buf, pos + 1)
+
+    while buf[pos:pos + 1] != b'}':
+        if buf[pos:pos + 1] != b'"':
+            raise ValueError('Expected a key at {}'.format(pos))
+
+        end = _STRING.match(buf, pos + 1).end()
+        key = json.loads(buf[pos:end])
+
+        pos = _skip_whitespace(buf, end)
+        if buf[pos:pos + 1] != b':':
+            raise ValueError('Expected \':\' at {}'.format(pos))
+
+        start = _skip_whitespace(buf, pos + 1)
+        end = _skip_value(buf, start)
+        yield key, start, end
+
+        pos = _skip_whitespace(buf, end)
+        if buf[pos:pos + 1] == b',':
+            pos = _skip_whitespace(buf, pos + 1)
+
+
+def _finished():
+    """
+    Finish a write which has been finished already, see
+    :meth:`Storage.begin_write`.
+    """
+
+
 class Storage(object):
     """
     A generic storage for TinyDB.
@@ -21,6 +163,31 @@ class Storage(object):
     """
     __metaclass__ = ABCMeta
 
+    #: Whether :meth:`write_table` writes a single table without rewriting
+    #: all other tables.
+    supports_table_writes = False
+
+    #: Whether :meth:`read_table` accepts a ``fields`` argument and can skip
+    #: decoding other fields of the elements.
+    supports_field_reads = False
+
+    #: Whether :meth:`read` and :meth:`read_table` may be called from
+    #: multiple threads at the same time (see
+    #: :class:`~tinydb.middlewares.ConcurrencyMiddleware`).
+    supports_concurrent_reads = False
+
+    #: The :class:`~tinydb.utils.Stats` to record I/O in (the counters
+    #: ``bytes_read`` and ``bytes_written``), see :meth:`attach_stats`.
+    stats = None
+
+    def attach_stats(self, stats):
+        """
+        Record the storage's I/O in ``stats``.
+
+        :type stats: tinydb.utils.Stats
+        """
+        self.stats = stats
+
     @abstractmethod
     def write(self, data):
         raise NotImplementedError('To be overriden!')
@@ -29,29 +196,992 @@ class Storage(object):
     def read(self):
         raise NotImplementedError('To be overriden!')
 
+    @contextmanager
+    def transaction(self):
+        """
+        Run a read-modify-write cycle exclusively.
+
+        TinyDB runs every modification inside a transaction. Storages which
+        can be shared with others (e.g. other processes) have to lock them
+        out until the transaction is finished. Nested transactions of the
+        same thread are part of the outermost one.
+        """
+        yield
+
+    def version(self):
+        """
+        Get a value which changes whenever the stored data is changed.
+
+        TinyDB compares it to notice changes made by others, storages which
+        can't be shared return None.
+        """
+        return None
+
+    def read_table(self, name):
+        """
+        Read a single table.
+
+        Storages that can read one table without reading all the others
+        should override this. Storages that can skip decoding fields should
+        accept a ``fields`` argument (a set of keys) and return elements
+        containing only these fields (if present), and set
+        :attr:`supports_field_reads`.
+
+        :raises KeyError: if there is no table with this name
+        """
+        return self.read()[name]
+
+    def read_element(self, table, id):
+        """
+        Read a single element of a table.
+
+        Storages that can read an element without reading the whole table
+        should override this.
+
+        :raises KeyError: if there is no such table or element
+        """
+        return self.read_table(table)[id]
+
+    def write_table(self, name, values):
+        """
+        Write a single table.
+
+        Storages that can write one table without rewriting all the others
+        should override this and set :attr:`supports_table_writes`.
+        """
+        try:
+            data = self.read()
+        except ValueError:
+            data = {}
+
+        data[name] = values
+        self.write(data)
+
+    def write_tables(self, tables):
+        """
+        Write multiple tables at once.
+
+        The tables are written with a single write, so either all or none of
+        them are changed if the write fails (as far as a write of the
+        storage is atomic). Storages which can write single tables should
+        override this if they can write multiple ones atomically too.
+
+        :param tables: the tables to write by their names
+        :type tables: dict
+        """
+        try:
+            data = self.read()
+        except ValueError:
+            data = {}
+
+        data.update(tables)
+        self.write(data)
+
+    def begin_write(self, data):
+        """
+        Start writing data.
+
+        The write is finished by calling the returned function. Middlewares
+        serializing writes (see
+        :class:`~tinydb.middlewares.ConcurrencyMiddleware`) only serialize
+        starting them, so a storage can wait for the writes of multiple
+        threads and finish them together. Reads have to return the data of
+        started writes. By default, the data is written right away.
+        """
+        self.write(data)
+        return _finished
+
+    def begin_write_table(self, name, values):
+        """
+        Start writing a single table, see :meth:`begin_write`.
+        """
+        if self.supports_table_writes:
+            self.write_table(name, values)
+            return _finished
+
+        try:
+            data = self.read()
+        except ValueError:
+            data = {}
+
+        data[name] = values
+        return self.begin_write(data)
+
 
 class JSONStorage(Storage):
     """
     Store the data in a JSON file.
+
+    With ``locking`` the file can be shared between multiple processes: Reads
+    take a shared and writes an exclusive lock on the file (using
+    ``fcntl.flock``), a :meth:`transaction` holds an exclusive lock until
+    it's finished. In addition, the file is only parsed again if it has been
+    changed since the last read or write, judging by its inode, size and
+    modification time.
+
+    With ``durable`` every write is crash safe: The data is written to a
+    temporary file which is synced to disk and then renamed over the
+    database file, so the file always contains either the old or the new
+    data. Writes from multiple threads are committed as a group: If other
+    writers are waiting, the first one waits ``commit_window`` seconds for
+    even more of them. It then writes the latest data of all writers with a
+    single fsync, and all of them return once it's on disk.
+
+    The file is opened by calling ``opener(path, mode)``, which allows to
+    wrap it (see :class:`~tinydb.middlewares.CompressionMiddleware`). Every
+    read opens the file again, so reads from multiple threads don't share a
+    file position.
     """
 
-    def __init__(self, path):
+    supports_concurrent_reads = True
+
+    def __init__(self, path, locking=False, opener=open, durable=False,
+                 commit_window=0.005):
         super(JSONStorage, self).__init__()
+        if locking and fcntl is None:
+            raise NotImplementedError('File locking is not supported on this '
+                                      'platform')
+
         touch(path)  # Create file if not exists
         self.path = path
-        self._handle = open(path, 'r+')
+        self.locking = locking
+        self.durable = durable
+        self.commit_window = commit_window
+        self._opener = opener
+        self._handle = opener(path, 'r+')
+
+        self._last = None  # The stat and data of the last read or write
+
+        # The thread running a transaction, see transaction()
+        self._transaction_lock = RLock()
+        self._transaction_owner = None
+
+        # Group commit state, see _commit()
+        self._commit_cond = Condition()
+        self._committing = False
+        self._pending = None
+        self._write_seq = 0
+        self._committed_seq = 0
+        self._committers = 0  # The threads waiting for a commit
 
     def __del__(self):
         self._handle.close()
 
     def write(self, data):
-        self._handle.seek(0)
-        json.dump(data, self._handle)
+        self.begin_write(data)()
+
+    def begin_write(self, data):
+        if self.durable and not self._in_transaction():
+            return partial(self._commit, self._stage(data))
+
+        with self._lock(exclusive=True):
+            if self.durable:
+                # Written right away, the transaction's lock is held anyway
+                self._write_atomic(json.dumps(data))
+            else:
+                self._handle.seek(0)
+                json.dump(data, self._handle)
+                self._handle.flush()
+                self._handle.truncate()
+                self._handle.flush()
+
+                if self.stats is not None:
+                    self.stats.count('bytes_written',
+                                     os.fstat(self._handle.fileno()).st_size)
+
+            if self.locking:
+                self._remember(data)
+
+        return _finished
+
+    def read(self):
+        with self._commit_cond:
+            if self._committed_seq < self._write_seq:
+                # Not yet committed. Decoded again, as the caller may modify
+                # the data while it's being committed.
+                return json.loads(self._pending)
+
+        with closing(self._opener(self.path, 'r')) as handle:
+            with self._lock(exclusive=False, handle=handle):
+                stat = self._stat(handle)
+                last = self._last
+                if self.locking and last is not None and last[0] == stat:
+                    return last[1]  # Unchanged
+
+                data = json.load(handle)
+
+                if self.locking:
+                    self._last = stat, data
+
+                if self.stats is not None:
+                    self.stats.count('bytes_read',
+                                     os.fstat(handle.fileno()).st_size)
+
+                return data
+
+    @contextmanager
+    def transaction(self):
+        if not self.locking:
+            yield
+            return
+
+        with self._transaction_lock:  # Excludes other threads
+            if self._in_transaction():
+                yield  # Nested
+                return
+
+            fd = self._lock_exclusive()
+            self._transaction_owner = current_thread()
+            try:
+                yield
+            finally:
+                self._transaction_owner = None
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def version(self):
+        if not self.locking:
+            return None
+
+        stat = os.stat(self.path)
+        return stat.st_ino, stat.st_size, stat.st_mtime, stat.st_ctime
+
+    def _stage(self, data):
+        """
+        Make data the latest data to commit.
+
+        The data is encoded right away, as the caller may modify it once the
+        write has been started (see :meth:`begin_write`).
+
+        :returns: the write's sequence number
+        """
+        raw = json.dumps(data)
+
+        with self._commit_cond:
+            self._write_seq += 1
+            self._pending = raw
+            return self._write_seq
+
+    def _commit(self, seq):
+        """
+        Write the staged data durably, grouped with the writes of other
+        threads.
+
+        Every write gets a sequence number (see :meth:`_stage`). The first
+        writer not finding a commit in progress becomes the leader and
+        commits the latest data of all writes staged until then. The others
+        wait for a commit covering their sequence number, or take over as
+        leader if the current commit doesn't cover it.
+        """
+        cond = self._commit_cond
+
+        with cond:
+            self._committers += 1
+            try:
+                while self._committing and self._committed_seq < seq:
+                    cond.wait()
+            finally:
+                self._committers -= 1
+
+            if self._committed_seq >= seq:
+                return  # Committed by another writer
+
+            self._committing = True
+
+            # Alone, there's nobody to wait for
+            window = self.commit_window if self._committers else 0
+
+        committed = None
+
+        try:
+            if window:
+                time.sleep(window)  # Let other writes join
+
+            with cond:
+                raw, upto = self._pending, self._write_seq
+
+            with self._lock(exclusive=True):
+                self._write_atomic(raw)
+
+                if self.locking:
+                    self._last = None  # Parsed again on the next read
+
+            committed = upto
+        finally:
+            with cond:
+                self._committing = False
+                if committed is not None:
+                    self._committed_seq = committed
+                cond.notify_all()
+
+    def _write_atomic(self, raw):
+        """
+        Replace the file by writing a new one containing the encoded data
+        and renaming it.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(
+            dir=directory, prefix=os.path.basename(self.path) + '.')
+        os.close(fd)
+
+        try:
+            os.chmod(tmp_path, stat.S_IMODE(os.stat(self.path).st_mode))
+
+            handle = self._opener(tmp_path, 'r+')
+            try:
+                handle.write(raw)
+                handle.flush()
+                os.fsync(handle.fileno())
+            finally:
+                handle.close()
+
+            _replace(tmp_path, self.path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+        _fsync_directory(directory)
+
+        self._handle.close()
+        self._handle = self._opener(self.path, 'r+')
+
+        if self.stats is not None:
+            self.stats.count('bytes_written',
+                             os.fstat(self._handle.fileno()).st_size)
+
+    @contextmanager
+    def _lock(self, exclusive, handle=None):
+        """
+        Lock the file if ``locking`` is enabled, using ``handle`` or the
+        storage's own handle. Inside a transaction, the file is locked
+        already.
+        """
+        if not self.locking or self._in_transaction():
+            yield
+            return
+
+        if handle is None:
+            # Another process may have replaced the file (e.g. by renaming a
+            # new version over it). Locking the old one wouldn't protect
+            # anything.
+            if (os.stat(self.path).st_ino !=
+                    os.fstat(self._handle.fileno()).st_ino):
+                self._handle.close()
+                self._handle = self._opener(self.path, 'r+')
+
+            handle = self._handle
+
+        fcntl.flock(handle.fileno(),
+                    fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+    def _lock_exclusive(self):
+        """
+        Lock the file exclusively using a file descriptor of its own, which
+        stays locked when the storage's handle is reopened.
+
+        :returns: the file descriptor
+        """
+        while True:
+            fd = os.open(self.path, os.O_RDONLY)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+
+            # Another process may have replaced the file while we were
+            # waiting, then the new one has to be locked
+            if os.fstat(fd).st_ino == os.stat(self.path).st_ino:
+                return fd
+
+            os.close(fd)
+
+    def _in_transaction(self):
+        return self._transaction_owner is current_thread()
+
+    def _stat(self, handle=None):
+        stat = os.fstat((handle or self._handle).fileno())
+        return stat.st_ino, stat.st_size, stat.st_mtime, stat.st_ctime
+
+    def _remember(self, data):
+        self._last = self._stat(), data
+
+
+class JSONLinesStorage(Storage):
+    """
+    Store the data as an append-only log of JSON records, one per line.
+
+    Instead of rewriting the whole file on every write, only the changes
+    since the last write are appended (inserted elements, removed IDs and
+    purged tables). The log is replayed when the storage is opened and
+    compacted into a single snapshot record once it has grown to more than
+    ``compact_ratio`` times the size of the last snapshot.
+
+    The records of one write are appended as a single line, so a write is
+    either replayed completely or not at all.
+
+    The elements are kept encoded, so reads hand out new objects and the
+    elements written next are compared to what has been stored, no matter
+    whether the caller modified them in place.
+    """
+
+    supports_concurrent_reads = True
+
+    #: Logs smaller than this (in bytes) are never compacted.
+    COMPACT_MIN_SIZE = 64 * 1024
+
+    supports_table_writes = True
+
+    def __init__(self, path, compact_ratio=2.0):
+        super(JSONLinesStorage, self).__init__()
+        touch(path)  # Create file if not exists
+        self.path = path
+        self.compact_ratio = compact_ratio
+
+        self._data = {}  # name -> id -> encoded element
+        self._snapshot_size = 0
+        self._log_size = 0
+
+        self._handle = None  # Not opened if replaying fails
+        self._replay()
+        self._handle = open(path, 'a')
+
+    def __del__(self):
+        if self._handle is not None:
+            self._handle.close()
+
+    def write(self, data):
+        records = [{'op': 'drop', 'table': name}
+                   for name in self._data if name not in data]
+
+        self._write_tables(data, records)
+        self._data = dict([(name, self._data[name]) for name in data])
+        self._compact_if_needed()
+
+    def read(self):
+        return dict([(name, self._decode_table(elements))
+                     for name, elements in self._data.iteritems()])
+
+    def write_table(self, name, values):
+        self.write_tables({name: values})
+
+    def read_table(self, name):
+        return self._decode_table(self._data[name])
+
+    def write_tables(self, tables):
+        self._write_tables(tables, [])
+        self._compact_if_needed()
+
+    def _write_tables(self, tables, records):
+        """
+        Append the records turning the stored tables into ``tables`` (after
+        ``records``) and remember the new tables.
+        """
+        encoded = {}
+        for name, values in tables.iteritems():
+            encoded[name] = self._encode_table(values)
+            records.extend(self._diff(name, self._data.get(name),
+                                      encoded[name], values))
+
+        self._append(records)
+        self._data.update(encoded)
+
+    def compact(self):
+        """
+        Replace the log by a single snapshot of the current state.
+
+        The snapshot is written to a temporary file first which then is
+        renamed over the log, so a crash never leaves a half-written log.
+        """
+        line = self._encode({'op': 'snapshot', 'data': dict([
+            (name, self._decode_table(elements).items())
+            for name, elements in self._data.iteritems()
+        ])})
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(
+            dir=directory, prefix=os.path.basename(self.path) + '.')
+
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+            _replace(tmp_path, self.path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+        _fsync_directory(directory)
+
+        self._handle.close()
+        self._handle = open(self.path, 'a')
+
+        self._snapshot_size = len(line)
+        self._log_size = 0
+
+        if self.stats is not None:
+            self.stats.count('bytes_written', len(line))
+
+    def _compact_if_needed(self):
+        if self._log_size > self.compact_ratio * max(self._snapshot_size,
+                                                     self.COMPACT_MIN_SIZE):
+            self.compact()
+
+    def _diff(self, name, old, new, values):
+        """
+        Get the records turning the encoded table ``old`` into ``new``.
+
+        :param values: the decoded elements of ``new``
+        """
+        if old is None:
+            old = {}
+            if not new:
+                return [{'op': 'purge', 'table': name}]  # Create the table
+
+        if not new:
+            return [{'op': 'purge', 'table': name}] if old else []
+
+        records = []
+
+        removed = [id for id in old if id not in new]
+        if removed:
+            records.append({'op': 'remove', 'table': name, 'ids': removed})
+
+        for id, raw in new.iteritems():
+            if old.get(id) != raw:
+                records.append({'op': 'insert', 'table': name, 'id': id,
+                                'element': values[id]})
+
+        return records
+
+    @staticmethod
+    def _encode_table(elements):
+        # Sorted keys, so equal elements are encoded equally
+        return dict([(id, json.dumps(element, sort_keys=True))
+                     for id, element in elements.iteritems()])
+
+    @staticmethod
+    def _decode_table(elements):
+        return dict([(id, json.loads(raw))
+                     for id, raw in elements.iteritems()])
+
+    def _append(self, records):
+        if not records:
+            return
+
+        if len(records) > 1:
+            # A torn line is dropped on replay, so a single line is appended
+            # either completely or not at all
+            records = [{'op': 'batch', 'records': records}]
+
+        lines = self._encode(records[0])
+        self._handle.write(lines)
         self._handle.flush()
+        self._log_size += len(lines)
+
+        if self.stats is not None:
+            self.stats.count('bytes_written', len(lines))
+
+    def _replay(self):
+        """
+        Rebuild the current state by applying all records in the log.
+        """
+        offset = 0
+        size = os.path.getsize(self.path)
+
+        with open(self.path, 'r') as f:
+            for line in f:
+                last = offset + len(line) == size
+
+                if not line.endswith('\n'):
+                    # An incomplete last record (e.g. after a crash while
+                    # appending), even if it happens to parse. Drop it so new
+                    # records start on a clean line.
+                    break
+
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    if last:
+                        break  # Torn the same way
+
+                    # Dropping it would drop all records after it, too
+                    raise ValueError('Corrupt record at offset {} in {}'
+                                     .format(offset, self.path))
+
+                self._apply(record)
+                offset += len(line)
+
+                if record['op'] == 'snapshot':
+                    self._snapshot_size = len(line)
+                    self._log_size = 0
+                else:
+                    self._log_size += len(line)
+
+        if offset != size:
+            with open(self.path, 'r+') as f:
+                f.truncate(offset)
+
+    def _apply(self, record):
+        op = record['op']
+
+        if op == 'snapshot':
+            self._data = dict([
+                (name, self._encode_table(dict(elements)))
+                for name, elements in record['data'].items()
+            ])
+        elif op == 'insert':
+            table = self._data.setdefault(record['table'], {})
+            table[record['id']] = json.dumps(record['element'],
+                                             sort_keys=True)
+        elif op == 'remove':
+            table = self._data.setdefault(record['table'], {})
+            for id in record['ids']:
+                table.pop(id, None)
+        elif op == 'purge':
+            self._data[record['table']] = {}
+        elif op == 'drop':
+            self._data.pop(record['table'], None)
+        elif op == 'batch':
+            for sub_record in record['records']:
+                self._apply(sub_record)
+
+    @staticmethod
+    def _encode(record):
+        return json.dumps(record) + '\n'
+
+
+class DirectoryStorage(Storage):
+    """
+    Store every table in a JSON file of its own inside a directory.
+
+    Reading or writing a table only touches the file of this table, so a
+    write to a small table stays cheap no matter how large the other tables
+    are. Writing multiple tables isn't atomic though: the files are written
+    one after another.
+    """
+
+    EXTENSION = '.json'
+
+    supports_table_writes = True
+    supports_concurrent_reads = True
+
+    def __init__(self, path):
+        super(DirectoryStorage, self).__init__()
+        if not os.path.isdir(path):
+            os.makedirs(path)  # Create directory if not exists
+        self.path = path
+
+    def write(self, data):
+        for name in self._tables():
+            if name not in data:
+                os.remove(self._table_path(name))
+
+        for name, values in data.iteritems():
+            self.write_table(name, values)
+
+    def read(self):
+        return dict([(name, self.read_table(name))
+                     for name in self._tables()])
+
+    def write_table(self, name, values):
+        with open(self._table_path(name), 'w') as f:
+            json.dump(values, f)
+
+            if self.stats is not None:
+                self.stats.count('bytes_written', f.tell())
+
+    def read_table(self, name):
+        try:
+            with open(self._table_path(name)) as f:
+                values = json.load(f)
+
+                if self.stats is not None:
+                    self.stats.count('bytes_read', f.tell())
+
+                return values
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                raise KeyError(name)
+            raise
+
+    def _tables(self):
+        """
+        Get the names of all tables stored in the directory.
+        """
+        return [unquote(fname[:-len(self.EXTENSION)])
+                for fname in os.listdir(self.path)
+                if fname.endswith(self.EXTENSION)]
+
+    def _table_path(self, name):
+        # Quote the name so every table name results in a valid file name
+        return os.path.join(self.path, quote(name, safe='') + self.EXTENSION)
+
+
+class LazyJSONStorage(Storage):
+    """
+    Read the data from a JSON file lazily, only parsing what is requested.
+
+    The file is memory-mapped and scanned (without decoding) to find where
+    the requested table is located, stopping as soon as it has been found.
+    Reading a table then decodes only this part of the file, so reading a
+    single table of a huge database doesn't require decoding all of it.
+    With ``index_elements`` the locations of a table's elements are recorded
+    when reading the first element, so only the element itself is decoded.
+
+    Once all tables have been located, their offsets are saved next to the
+    file (as ``<path>.idx``), so they don't have to be scanned again until
+    the file changes.
+
+    The storage is read-only, writing raises an :class:`IOError`.
+    """
+
+    INDEX_SUFFIX = '.idx'
+
+    def __init__(self, path, index_elements=False):
+        super(LazyJSONStorage, self).__init__()
+        self.path = path
+        self.index_elements = index_elements
+        self._handle = open(path, 'rb')
+        self._mmap = None
+        self._tables = {}
+        self._elements = {}
+        self._members = None  # Iterates over the tables not yet located
+
+        stat = os.fstat(self._handle.fileno())
+        self._key = [stat.st_size, stat.st_mtime, stat.st_ctime, stat.st_ino]
+
+        if stat.st_size:
+            self._mmap = mmap.mmap(self._handle.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+
+            if not self._load_index():
+                self._members = _iter_object(self._mmap, 0)
+
+    def __del__(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._handle.close()
+
+    def write(self, data):
+        raise IOError('{} is opened read-only'.format(self.path))
 
     def read(self):
+        if self._mmap is None:
+            raise ValueError('No JSON object could be decoded')
+
+        self._locate()
+        return dict([(name, self.read_table(name)) for name in self._tables])
+
+    def write_table(self, name, values):
+        raise IOError('{} is opened read-only'.format(self.path))
+
+    def read_table(self, name):
+        self._locate(name)
+        start, end = self._tables[name]
+
+        if self.stats is not None:
+            self.stats.count('bytes_read', end - start)
+
+        return json.loads(self._mmap[start:end])
+
+    def read_element(self, table, id):
+        """
+        Read a single element of a table.
+
+        Only the element itself is decoded if the storage has been opened
+        with ``index_elements``.
+
+        :raises KeyError: if there is no such table or element
+        """
+        if not self.index_elements:
+            return self.read_table(table)[id]
+
+        elements = self._elements.get(table)
+        if elements is None:
+            self._locate(table)
+            elements = self._elements[table] = dict([
+                (el_id, (el_start, el_end)) for el_id, el_start, el_end
+                in _iter_object(self._mmap, self._tables[table][0])
+            ])
+
+        start, end = elements[id]
+
+        if self.stats is not None:
+            self.stats.count('bytes_read', end - start)
+
+        return json.loads(self._mmap[start:end])
+
+    def _locate(self, name=None):
+        """
+        Scan the file until the table ``name`` has been located, or all
+        tables if ``name`` is None.
+        """
+        while self._members is not None and (name is None or
+                                             name not in self._tables):
+            try:
+                key, start, end = next(self._members)
+            except StopIteration:
+                self._members = None
+                self._save_index()
+                break
+
+            self._tables[key] = (start, end)
+
+    def _load_index(self):
+        """
+        Load the saved table offsets, if they belong to the current file.
+
+        :returns: whether the offsets have been loaded
+        """
+        try:
+            with open(self.path + self.INDEX_SUFFIX) as f:
+                index = json.load(f)
+
+            if index['key'] != self._key:
+                return False
+
+            self._tables = dict([(name, tuple(offsets)) for name, offsets
+                                 in index['tables'].items()])
+            return True
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return False
+
+    def _save_index(self):
+        """
+        Save the table offsets. Failing to do so (e.g. in a read-only
+        directory) only means they have to be scanned again next time.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+
+        try:
+            fd, tmp_path = tempfile.mkstemp(
+                dir=directory, prefix=os.path.basename(self.path) + '.')
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'key': self._key, 'tables': self._tables}, f)
+
+            _replace(tmp_path, self.path + self.INDEX_SUFFIX)
+        except (IOError, OSError):
+            pass
+
+
+class BinaryStorage(Storage):
+    """
+    Store the data in a file using a binary serialization format.
+
+    Subclasses define the format by implementing :meth:`encode` and
+    :meth:`decode`. Binary formats are faster to parse than JSON and keep
+    the types of the keys, so integer IDs stay integers.
+
+    The file is opened by calling ``opener(path, mode)`` (see
+    :class:`JSONStorage`). Like there, every read opens the file again.
+    """
+
+    supports_concurrent_reads = True
+
+    #: The size of the pieces the encoded data is written in (in bytes)
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, path, opener=open):
+        super(BinaryStorage, self).__init__()
+        touch(path)  # Create file if not exists
+        self.path = path
+        self._opener = opener
+        self._handle = opener(path, 'r+b')
+
+    def __del__(self):
+        self._handle.close()
+
+    def write(self, data):
+        raw = self.encode(data)
+
         self._handle.seek(0)
-        return json.load(self._handle)
+        for start in range(0, len(raw), self.CHUNK_SIZE):
+            self._handle.write(raw[start:start + self.CHUNK_SIZE])
+        self._handle.truncate()
+        self._handle.flush()
+
+        if self.stats is not None:
+            self.stats.count('bytes_written', len(raw))
+
+    def read(self):
+        with closing(self._opener(self.path, 'rb')) as handle:
+            raw = handle.read()
+
+        if not raw:
+            raise ValueError('The file is empty')
+
+        if self.stats is not None:
+            self.stats.count('bytes_read', len(raw))
+
+        return self.decode(raw)
+
+    @abstractmethod
+    def encode(self, data):
+        """
+        Serialize the data to a byte string.
+        """
+        raise NotImplementedError('To be overriden!')
+
+    @abstractmethod
+    def decode(self, raw):
+        """
+        Deserialize the data from a byte string.
+        """
+        raise NotImplementedError('To be overriden!')
+
+
+class MarshalStorage(BinaryStorage):
+    """
+    Store the data using the :mod:`marshal` format.
+
+    The fastest format, but it may change between Python versions.
+    """
+
+    def encode(self, data):
+        return marshal.dumps(data, 2)
+
+    def decode(self, raw):
+        return marshal.loads(raw)
+
+
+class PickleStorage(BinaryStorage):
+    """
+    Store the data using :mod:`pickle` with the highest protocol available.
+
+    Never open files from untrusted sources, unpickling can execute
+    arbitrary code.
+    """
+
+    PROTOCOL = pickle.HIGHEST_PROTOCOL
+
+    def encode(self, data):
+        return pickle.dumps(data, self.PROTOCOL)
+
+    def decode(self, raw):
+        return pickle.loads(raw)
+
+
+class MsgPackStorage(BinaryStorage):
+    """
+    Store the data using MessagePack.
+
+    Requires the ``msgpack`` package (version 1.0 or newer).
+    """
+
+    def __init__(self, path, opener=open):
+        if msgpack is None:
+            raise ImportError('MsgPackStorage requires the msgpack package')
+
+        super(MsgPackStorage, self).__init__(path, opener)
+
+    def encode(self, data):
+        return msgpack.packb(data, use_bin_type=True)
+
+    def decode(self, raw):
+        return msgpack.unpackb(raw, raw=False, strict_map_key=False)
 
 
 class MemoryStorage(Storage):
@@ -59,6 +1189,8 @@ class MemoryStorage(Storage):
     Store the data as JSON in memory.
     """
 
+    supports_concurrent_reads = True
+
     def __init__(self, path=None):
         super(MemoryStorage, self).__init__()
         self.memory = None
@@ -0,0 +1,64 @@
+from nose import SkipTest
+from nose.tools import *
+
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        raise SkipTest('Neither asyncio nor trollius is available')
+
+from tinydb import field
+from tinydb.aio import AsyncTinyDB
+from tinydb.storages import MemoryStorage
+
+#: :type: AsyncTinyDB
+db = None
+loop = None
+
+
+def setup():
+    global db, loop
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    db = AsyncTinyDB(storage=MemoryStorage)
+
+
+def teardown():
+    loop.run_until_complete(db.close())
+    loop.close()
+
+
+def run(awaitable):
+    return loop.run_until_complete(awaitable)
+
+
+def test_insert_search():
+    run(db.purge())
+
+    run(db.insert({'int': 1, 'char': 'a'}))
+    run(db.insert({'int': 1, 'char': 'b'}))
+
+    assert_equal(len(run(db.search(field('int') == 1))), 2)
+    assert_equal(run(db.get(field('char') == 'b'))['char'], 'b')
+    assert_equal(run(db.count()), 2)
+
+
+def test_order():
+    run(db.purge())
+
+    # Issued without waiting in between, still executed in order
+    pending = [db.insert({'int': i}) for i in range(10)]
+    pending.append(db.remove(field('int') < 5))
+    pending.append(db.count())
+
+    assert_equal(run(asyncio.gather(*pending))[-1], 5)
+
+
+def test_tables():
+    table = db.table('table1')
+    run(table.purge())
+    run(table.insert_multiple({'int': i} for i in range(3)))
+
+    assert_equal(len(run(table.all())), 3)
@@ -1,7 +1,14 @@
+import gzip
+import json
+import os
+import tempfile
 from threading import Thread
 
-from tinydb.middlewares import CachingMiddleware, ConcurrencyMiddleware
-from tinydb.storages import MemoryStorage
+from tinydb import TinyDB
+from tinydb.middlewares import (CachingMiddleware, ConcurrencyMiddleware,
+                                CompressionMiddleware)
+from tinydb.storages import (JSONStorage, JSONLinesStorage, LazyJSONStorage,
+                             PickleStorage, MemoryStorage)
 
 from nose.tools import *
 
@@ -123,6 +130,123 @@ def test_concurrency():
     assert_equal(len(backend.memory), run_count)
 
 
+def setup_concurrency_read_write_lock():
+    global backend
+    _backend = ConcurrencyMiddleware(MemoryStorage, read_write_lock=True)
+    backend = _backend()  # Initialize MemoryStorage
+
+
+@with_setup(setup_concurrency_read_write_lock)
+def test_concurrency_read_write_lock():
+    global backend
+    threads = []
+    run_count = 42
+
+    class WriteThread(Thread):
+        def run(self):
+            # Readers don't exclude each other, so the read-modify-write
+            # has to run in a transaction
+            with backend.transaction():
+                try:
+                    current_contents = backend.read()
+                except ValueError:
+                    current_contents = []
+                backend.write(current_contents + [element])
+
+    for i in xrange(run_count):
+        thread = WriteThread()
+        threads.append(thread)
+        thread.start()
+
+    for t in threads:
+        t.join()
+
+    assert_equal(len(backend.memory), run_count)
+
+
+def test_concurrency_read_write_lock_json():
+    tmp = tempfile.NamedTemporaryFile(delete=False)
+    tmp.close()
+
+    try:
+        _backend = ConcurrencyMiddleware(JSONStorage, read_write_lock=True)
+        backend = _backend(tmp.name)
+        backend.write({'_default': dict([(str(i), element)
+                                         for i in range(1000)])})
+        errors = []
+
+        def read():
+            try:
+                for _ in range(20):
+                    assert_equal(len(backend.read()['_default']), 1000)
+            except Exception as e:
+                errors.append(e)
+
+        # Readers running at the same time don't share a file position
+        threads = [Thread(target=read) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert_equal(errors, [])
+    finally:
+        os.unlink(tmp.name)
+
+
+def test_concurrency_read_write_lock_unsupported():
+    tmp = tempfile.NamedTemporaryFile(delete=False)
+    tmp.close()
+
+    try:
+        _backend = ConcurrencyMiddleware(LazyJSONStorage, read_write_lock=True)
+        assert_raises(ValueError, _backend, tmp.name)
+    finally:
+        os.unlink(tmp.name)
+
+
+def test_concurrency_durable():
+    tmp = tempfile.NamedTemporaryFile(delete=False)
+    tmp.close()
+
+    fsync = os.fsync
+    fsyncs = []
+
+    def counting_fsync(fd):
+        fsyncs.append(fd)
+        fsync(fd)
+
+    try:
+        _backend = ConcurrencyMiddleware(JSONStorage)
+        db = TinyDB(tmp.name, durable=True, commit_window=0.001,
+                    storage=_backend)
+        errors = []
+
+        def insert():
+            try:
+                for i in range(100):
+                    db.insert({'int': i})
+            except Exception as e:
+                errors.append(e)
+
+        os.fsync = counting_fsync
+        try:
+            threads = [Thread(target=insert) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            os.fsync = fsync
+
+        # The lock isn't held while committing, so writes have been grouped
+        assert_equal(errors, [])
+        assert_equal(len(TinyDB(tmp.name)), 8 * 100)
+        assert_true(len(fsyncs) < 8 * 100 * 2)
+    finally:
+        os.unlink(tmp.name)
+
+
 def setup_nested():
     global backend
     _backend = ConcurrencyMiddleware(CachingMiddleware(MemoryStorage))
@@ -137,3 +261,88 @@ def test_nested():
 
     # Verify contents
     assert_equal(element, backend.read())
+
+
+def test_caching_read():
+    _backend = CachingMiddleware(MemoryStorage)
+    backend = _backend()
+    backend.storage.memory = {'_default': {1: element}}
+
+    # Read through to the storage once, then from the cache
+    assert_equal(backend.read(), {'_default': {1: element}})
+    backend.storage.memory = None
+    assert_equal(backend.read(), {'_default': {1: element}})
+
+
+def test_caching_dirty_tables():
+    tmp = tempfile.NamedTemporaryFile(delete=False)
+    tmp.close()
+
+    try:
+        _backend = CachingMiddleware(JSONLinesStorage)
+        backend = _backend(tmp.name)
+        backend.write_table('table1', {1: element})
+        backend.flush()
+
+        written = []
+        backend.storage.write = written.append  # Full writes
+
+        backend.write_table('table2', {1: element})
+        backend.flush()
+
+        assert_equal(written, [])
+        assert_equal(JSONLinesStorage(tmp.name).read(),
+                     {'table1': {1: element}, 'table2': {1: element}})
+    finally:
+        os.unlink(tmp.name)
+
+
+def test_compression():
+    tmp = tempfile.NamedTemporaryFile(delete=False)
+    tmp.close()
+
+    data = {'_default': dict([(str(i), element) for i in range(100)])}
+
+    try:
+        for codec in ('zlib', 'bz2'):
+            os.unlink(tmp.name)
+
+            _backend = CompressionMiddleware(JSONStorage, codec=codec)
+            backend = _backend(tmp.name)
+            assert_raises(ValueError, backend.read)  # Empty file
+
+            backend.write(data)
+            backend.write({})
+            backend.write(data)
+
+            assert_equal(backend.read(), data)
+            assert_true(os.path.getsize(tmp.name) < len(json.dumps(data)))
+
+            # Binary storages, written in pieces
+            _backend = CompressionMiddleware(PickleStorage, codec=codec)
+            backend = _backend(tmp.name)
+            backend.storage.CHUNK_SIZE = 100
+            backend.write(data)
+            assert_equal(backend.read(), data)
+
+            # Reading doesn't need write access
+            handle = _backend._open(tmp.name, 'rb')
+            assert_equal(handle._raw.mode, 'rb')
+            handle.close()
+    finally:
+        os.unlink(tmp.name)
+
+
+def test_compression_gzip():
+    tmp = tempfile.NamedTemporaryFile(delete=False)
+    tmp.close()
+
+    try:
+        _backend = CompressionMiddleware(JSONStorage)
+        _backend(tmp.name).write({'_default': {'1': element}})
+
+        # The zlib codec writes gzip files
+        with gzip.open(tmp.name) as f:
+            assert_equal(json.loads(f.read()), {'_default': {'1': element}})
+    finally:
+        os.unlink(tmp.name)
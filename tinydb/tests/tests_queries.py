@@ -105,3 +105,52 @@ def test_custom():
     assert_false(query({'val': 40}))
     assert_false(query({'val': '44'}))
     assert_false(query({'': None}))
+
+
+def test_compile():
+    query = ((field('val1') == 1) & (field('val2') > 1) &
+             (field('val3') != 0)) | field('val4').matches(r'[a-z]')
+    test = query.compile()
+
+    assert_true(test is query.compile())  # Cached
+    assert_true(test({'val1': 1, 'val2': 2, 'val3': 1, 'val4': '1'}))
+    assert_true(test({'val4': 'a'}))
+    assert_false(test({'val1': 1, 'val2': 1, 'val3': 1, 'val4': '1'}))
+
+
+def test_compile_modified():
+    query = field('val')
+    assert_true(query({'val': 1}))
+
+    query == 2
+    assert_false(query({'val': 1}))
+    assert_true(query({'val': 2}))
+
+
+def test_fields():
+    query = ((field('a') == 1) | ~(field('b') == 2)) & field('c')
+    assert_equal(query._fields(), set(['a', 'b', 'c']))
+
+    query = (field('a') == 1) & (lambda element: True)
+    assert_equal(query._fields(), None)
+
+
+def test_compile_deeply_nested():
+    # Chains nested on the right are flattened, too
+    query = field('value') == -1
+    for i in range(200):
+        query = (field('value') == i) | query
+
+    assert_true(query({'value': 150}))
+    assert_false(query({'value': 500}))
+
+    # Nesting which can't be flattened falls back to nested functions
+    query = field('value') == -1
+    for i in range(200):
+        if i % 2:
+            query = (field('value') == i) | query
+        else:
+            query = (field('other') != i) & query
+
+    assert_true(query({'value': 199, 'other': 1000}))
+    assert_false(query({'value': 1000, 'other': 0}))
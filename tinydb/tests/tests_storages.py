@@ -1,11 +1,18 @@
+import json
 import os
+import shutil
 import tempfile
 import random
+import time
+from threading import Thread
 random.seed()
 
 from nose.tools import *
 
-from tinydb.storages import JSONStorage, MemoryStorage
+from tinydb.storages import (JSONStorage, JSONLinesStorage, DirectoryStorage,
+                             LazyJSONStorage, MarshalStorage, PickleStorage,
+                             MemoryStorage)
+from tinydb.utils import Stats
 
 path = None
 element = {'none': [None, None], 'int': 42, 'float': 3.1415899999999999,
@@ -44,3 +51,249 @@ def test_in_memory():
 
     # Verify contents
     assert_equal(element, backend.read())
+
+
+def test_json_lines():
+    os.unlink(path)
+
+    # Write contents
+    backend = JSONLinesStorage(path)
+    backend.write({'_default': {1: element}})
+    backend.write({'_default': {1: element, 2: {'int': 1}}, 'other': {}})
+    backend.write({'_default': {2: {'int': 2}}})
+
+    # The log has to be replayed on open
+    expected = {'_default': {2: {'int': 2}}}
+    assert_equal(expected, backend.read())
+    assert_equal(expected, JSONLinesStorage(path).read())
+
+
+def test_json_lines_modified_in_place():
+    os.unlink(path)
+
+    backend = JSONLinesStorage(path)
+    backend.write({'_default': {1: {'int': 1}}})
+
+    # Elements modified in place by the caller are written, too
+    data = backend.read()
+    data['_default'][1]['int'] = 99
+    data['_default'][2] = {'int': 2}
+    backend.write(data)
+
+    expected = {'_default': {1: {'int': 99}, 2: {'int': 2}}}
+    assert_equal(backend.read(), expected)
+    assert_equal(JSONLinesStorage(path).read(), expected)
+
+
+def test_json_lines_torn():
+    os.unlink(path)
+
+    backend = JSONLinesStorage(path)
+    backend.write({'_default': {1: {'int': 1}}})
+
+    # A crash while appending left a record without its newline, which
+    # happens to parse
+    with open(path, 'a') as f:
+        f.write(json.dumps({'op': 'purge', 'table': '_default'}))
+
+    backend = JSONLinesStorage(path)
+    backend.write({'_default': {1: {'int': 1}, 2: {'int': 2}}})
+    backend.write({'_default': {1: {'int': 1}, 2: {'int': 2}, 3: {'int': 3}}})
+
+    assert_equal(len(JSONLinesStorage(path).read()['_default']), 3)
+
+    # A corrupt record in the middle isn't dropped silently
+    with open(path) as f:
+        lines = f.readlines()
+    lines[1] = '{"op": \n'
+    with open(path, 'w') as f:
+        f.writelines(lines)
+
+    assert_raises(ValueError, JSONLinesStorage, path)
+
+
+def test_json_lines_write_tables():
+    os.unlink(path)
+
+    backend = JSONLinesStorage(path)
+    backend.write({'table1': {1: {'int': 1}}, 'table2': {}})
+    backend.write_tables({'table1': {1: {'int': 1}, 2: {'int': 2}},
+                          'table2': {1: {'int': 3}}})
+
+    expected = {'table1': {1: {'int': 1}, 2: {'int': 2}},
+                'table2': {1: {'int': 3}}}
+    assert_equal(backend.read(), expected)
+    assert_equal(JSONLinesStorage(path).read(), expected)
+
+    # Torn while appending, none of the tables has been changed
+    with open(path) as f:
+        lines = f.readlines()
+    assert_equal(len(lines), 2)
+    with open(path, 'w') as f:
+        f.writelines([lines[0], lines[1][:-10]])
+
+    assert_equal(JSONLinesStorage(path).read(),
+                 {'table1': {1: {'int': 1}}, 'table2': {}})
+
+
+def test_json_lines_compact():
+    os.unlink(path)
+
+    backend = JSONLinesStorage(path, compact_ratio=0.5)
+    backend.COMPACT_MIN_SIZE = 0
+
+    for i in range(1, 10):
+        data = backend.read()
+        data.setdefault('_default', {})[i] = element
+        backend.write(data)
+
+    # The log has been compacted into a snapshot
+    with open(path) as f:
+        lines = f.readlines()
+    assert_true(len(lines) < 9)
+    assert_equal(json.loads(lines[0])['op'], 'snapshot')
+
+    assert_equal(len(JSONLinesStorage(path).read()['_default']), 9)
+
+    # No temporary files are left behind
+    directory, name = os.path.split(path)
+    assert_equal([f for f in os.listdir(directory)
+                  if f.startswith(name + '.')], [])
+
+
+def test_directory():
+    directory = tempfile.mkdtemp()
+
+    try:
+        backend = DirectoryStorage(directory)
+        backend.write({'table1': {'1': element}, 'a/b': {}})
+        backend.write_table('table2', {'1': element})
+
+        assert_equal(sorted(os.listdir(directory)),
+                     ['a%2Fb.json', 'table1.json', 'table2.json'])
+        assert_equal(backend.read_table('table2'), {'1': element})
+        assert_raises(KeyError, backend.read_table, 'table3')
+
+        backend.write({'table1': {}})
+        assert_equal(backend.read(), {'table1': {}})
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_lazy():
+    data = {'table1': {'1': element, '2': {'s': '"}{\\'}},
+            'table2': {'1': [1, {'a': None}]}, 'table3': {}}
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+    backend = LazyJSONStorage(path, index_elements=True)
+
+    assert_equal(backend.read_table('table1'), data['table1'])
+    assert_equal(backend.read_element('table1', '2'), {'s': '"}{\\'})
+    assert_equal(backend.read_element('table2', '1'), [1, {'a': None}])
+    assert_equal(backend.read(), data)
+    assert_raises(KeyError, backend.read_table, 'table4')
+    assert_raises(IOError, backend.write, data)
+
+    # The offsets are reused by the next storage opened on the same file
+    backend = LazyJSONStorage(path)
+    assert_equal(backend._members, None)
+    assert_equal(backend.read_table('table2'), data['table2'])
+
+    # But not once the file has changed
+    with open(path, 'w') as f:
+        json.dump({'table1': {}}, f)
+    backend = LazyJSONStorage(path)
+    assert_equal(backend._tables, {})  # Nothing has been scanned yet
+    assert_equal(backend.read(), {'table1': {}})
+
+    os.unlink(path + LazyJSONStorage.INDEX_SUFFIX)
+
+
+def test_json_locking():
+    backend1 = JSONStorage(path, locking=True)
+    backend2 = JSONStorage(path, locking=True)
+
+    backend1.write({'_default': {'1': element}})
+    assert_equal(backend2.read(), {'_default': {'1': element}})
+
+    # Not parsed again while unchanged
+    assert_true(backend2.read() is backend2.read())
+
+    backend1.write({})
+    assert_equal(backend2.read(), {})
+
+
+def test_json_shrink():
+    backend = JSONStorage(path)
+    backend.write({'_default': {'1': element, '2': element}})
+    backend.write({})
+
+    assert_equal(backend.read(), {})
+
+
+def test_binary():
+    data = {'_default': {1: element}}
+
+    for storage in (MarshalStorage, PickleStorage):
+        os.unlink(path)
+        backend = storage(path)
+        assert_raises(ValueError, backend.read)
+
+        backend.write(data)
+        backend.write({'_default': {}})
+        backend.write(data)
+
+        # Integer IDs are kept
+        assert_equal(data, storage(path).read())
+
+
+def test_json_durable():
+    backend = JSONStorage(path, durable=True, commit_window=0.05)
+    fsync = os.fsync
+    fsyncs = []
+
+    def counting_fsync(fd):
+        fsyncs.append(fd)
+        fsync(fd)
+
+    def write(i):
+        backend.write({'_default': {'1': {'int': i}}})
+
+    os.fsync = counting_fsync
+    try:
+        threads = [Thread(target=write, args=(i, )) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        os.fsync = fsync
+
+    # All writes have been committed with fewer fsyncs (file + directory)
+    assert_true(len(fsyncs) < 10 * 2)
+    assert_equal(JSONStorage(path).read(), backend.read())
+
+    # No temporary files are left behind
+    directory, name = os.path.split(path)
+    assert_equal([f for f in os.listdir(directory)
+                  if f.startswith(name + '.')], [])
+
+    # A single writer doesn't wait for others
+    backend = JSONStorage(path, durable=True, commit_window=10)
+    start = time.time()
+    backend.write({})
+    assert_true(time.time() - start < 10)
+
+
+def test_json_stats():
+    stats = Stats()
+    backend = JSONStorage(path)
+    backend.attach_stats(stats)
+
+    backend.write(element)
+    backend.read()
+
+    size = os.path.getsize(path)
+    assert_equal(stats.snapshot()['counters'],
+                 {'bytes_written': size, 'bytes_read': size})
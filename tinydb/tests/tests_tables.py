@@ -1,6 +1,11 @@
-from tinydb import TinyDB, field
+from itertools import islice
+from threading import Thread
+
+from tinydb import TinyDB, field, parallel
+from tinydb.columnar import numpy
 from tinydb.storages import MemoryStorage
 
+from nose import SkipTest
 from nose.tools import *
 
 #: :type: TinyDB
@@ -52,3 +57,197 @@ def test_caching():
 
     assert_equal(len(table1.search(field('int') == 1)), 2)
     assert_equal(len(table2.search(field('int') == 1)), 2)
+
+
+def test_index():
+    db.purge_all()
+
+    table = db.table('indexed')
+    table.create_index('int')
+
+    table.insert({'int': 1, 'char': 'a'})
+    table.insert({'int': 1, 'char': 'b'})
+    table.insert({'int': 2, 'char': 'c'})
+    table.insert({'char': 'd'})
+
+    assert_equal(table._candidates(field('int') == 1), set([1, 2]))
+    assert_equal(len(table.search(field('int') == 1)), 2)
+    assert_equal(len(table.search((field('int') == 1) &
+                                  (field('char') == 'b'))), 1)
+    assert_equal(len(table.search((field('int') == 1) |
+                                  (field('int') == 2))), 3)
+    assert_equal(table.get(field('int') == 2)['char'], 'c')
+
+    table.remove(field('char') == 'a')
+    assert_equal(len(table.search(field('int') == 1)), 1)
+
+    table.purge()
+    assert_equal(len(table.search(field('int') == 1)), 0)
+
+    table.drop_index('int')
+    assert_equal(table._candidates(field('int') == 1), None)
+
+
+def test_ordered_index():
+    db.purge_all()
+
+    table = db.table('ordered')
+    table.create_index('ts', ordered=True)
+
+    for i in range(10):
+        table.insert({'ts': i})
+
+    assert_equal(len(table.search(field('ts') < 3)), 3)
+    assert_equal(len(table.search(field('ts') <= 3)), 4)
+    assert_equal(len(table.search(field('ts') > 3)), 6)
+    assert_equal(len(table.search(field('ts') >= 3)), 7)
+    assert_equal(len(table.search(field('ts') == 3)), 1)
+
+    where = (field('ts') >= 2) & (field('ts') < 5)
+    assert_equal(len(table._candidates(where)), 3)
+    assert_equal(sorted([e['ts'] for e in table.search(where)]), [2, 3, 4])
+
+    table.remove(field('ts') == 3)
+    assert_equal(len(table.search((field('ts') >= 2) & (field('ts') < 5))), 2)
+
+    # Many elements at once are merged into the index
+    table.insert_multiple({'ts': i % 50} for i in range(500))
+    assert_equal(table._indexes['ts']._values,
+                 sorted(e['ts'] for e in table.all()))
+    assert_equal(len(table.search(field('ts') == 2)), 11)
+    assert_equal(len(table.search((field('ts') >= 2) & (field('ts') < 5))),
+                 32)
+
+
+def test_query_cache():
+    db.purge_all()
+
+    table = db.table('cached', cache_size=1)
+    table.insert({'int': 1})
+
+    table.search(field('int') == 1)
+    table.search(field('int') == 1)
+    table.search(field('int') == 2)
+
+    info = table.query_cache_info()
+    assert_equal((info['hits'], info['misses'], info['evictions']), (1, 2, 1))
+    assert_equal(info['entries'], 1)
+
+
+def test_options_of_cached_table():
+    tiny = TinyDB(storage=MemoryStorage)
+    tiny.insert({'int': 1})
+
+    # The default table already exists, the options are applied to it
+    table = tiny.table('_default', cache_size=0, processes=2)
+    assert_true(table is tiny.table('_default'))
+    assert_equal(table._processes, 2)
+
+    tiny.search(field('int') == 1)
+    assert_equal(table.query_cache_info()['entries'], 0)
+
+    # Options not given are kept
+    tiny.table('_default', cache_memory=1000)
+    assert_equal(table._queries_cache.capacity, 0)
+    assert_equal(table._processes, 2)
+
+    assert_raises(TypeError, tiny.table, '_default', unknown=1)
+
+
+def is_odd(value):
+    return value % 2 == 1
+
+
+def test_parallel_search():
+    table = TinyDB(storage=MemoryStorage).table('parallel', processes=2)
+    table.PARALLEL_MIN_SIZE = 10
+    table.insert_multiple({'int': i, 'char': 'c{}'.format(i)}
+                          for i in range(50))
+
+    query = field('int').test(is_odd) & field('char').matches('c[1-3]')
+    query(table.get(1))  # Compiled queries can be pickled, too
+
+    # Merged in the order of the IDs
+    assert_equal(table.search(query),
+                 [{'int': i, 'char': 'c{}'.format(i)}
+                  for i in range(50) if i % 2 and str(i)[0] in '123'])
+
+    table.create_index('int', ordered=True)
+    assert_equal(len(table.search((field('int') < 40) &
+                                  field('int').test(is_odd))), 20)
+    assert_equal(table._db.stats()['counters']['parallel_scans'], 2)
+
+    # Not for callers stopping at the first matches
+    query = field('int').test(is_odd)
+    assert_true(table.contains(query))
+    assert_true(table.get(query) is not None)
+    assert_equal(len(table.search(query, limit=2)), 2)
+    assert_equal(len(list(islice(table.search_iter(query), 2))), 2)
+    assert_equal(table._db.stats()['counters']['parallel_scans'], 2)
+
+    # Multiple threads scanning at the same time
+    results = []
+    threads = [Thread(target=lambda: results.append(
+        len(table.search(field('char').matches('c[1-3]')))))
+        for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert_equal(results, [len([i for i in range(50)
+                                if str(i)[0] in '123'])] * 4)
+
+    # Queries which can't be pickled are inherited by forked workers, and
+    # tested serially otherwise
+    scans = table._db.stats()['counters']['parallel_scans']
+    query = field('int').test(lambda value: value > 45)
+    assert_equal(len(table.search(query)), 4)
+
+    uses_fork = parallel._uses_fork
+    parallel._uses_fork = lambda: False
+    try:
+        table._clear_query_cache()
+        assert_equal(len(table.search(query)), 4)
+    finally:
+        parallel._uses_fork = uses_fork
+
+    expected = scans + 1 if uses_fork() else scans
+    assert_equal(table._db.stats()['counters']['parallel_scans'], expected)
+
+
+def test_columnar():
+    if numpy is None:
+        raise SkipTest('NumPy is not installed')
+
+    table = TinyDB(storage=MemoryStorage).table('columnar', columnar=True)
+    table.insert_multiple([{'int': i, 'char': c}
+                           for i, c in zip(range(10), 'abcdefghij')])
+    table.insert_multiple([{'int': 2.0}, {'int': True}, {'int': 'x'},
+                           {'int': None}, {'int': [1]}, {'char': u'b'},
+                           {'int': 2 ** 60}, {'char': 'x'}, {}])
+
+    queries = [
+        field('int') == 2,
+        field('int') != 2,
+        (field('int') >= 1) & (field('int') < 4),
+        (field('int') < 2) | (field('char') == 'j'),
+        ~(field('char') == 'b'),
+        field('int') > 'a',
+        field('int') == [1],
+        field('int') < 2 ** 61,
+        field('char'),
+        field('missing') == 1,
+        field('char') == 'x\0',
+        field('char') != '\xc3\xa9',
+        (field('int') > 5) & field('char').matches('[g-h]'),
+    ]
+
+    rows = TinyDB(storage=MemoryStorage).table('rows')
+    rows.insert_multiple(table.all())
+
+    for query in queries:
+        assert_equal(sorted(table.search(query)), sorted(rows.search(query)))
+
+    # Rebuilt after modifications
+    table.remove(field('int') == 2)
+    assert_equal(table.search(field('int') == 2), [])
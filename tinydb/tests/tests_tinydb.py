@@ -1,5 +1,13 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from multiprocessing import Process
+
+import tinydb
 from tinydb import TinyDB, field
-from tinydb.storages import MemoryStorage
+from tinydb.storages import LazyJSONStorage, MemoryStorage
 
 from nose.tools import *
 
@@ -158,3 +166,340 @@ def test_get_by_id():
 
     for id in data.keys():
         assert_equal(db.get(id)['int'], 1)
+
+
+def test_combined_queries():
+    db.purge()
+
+    db.insert({'int': 1, 'char': 'a'})
+    db.insert({'int': 1, 'char': 'b'})
+    db.insert({'int': 1, 'char': 'c'})
+
+    where = (field('int') == 1) & ~(field('char') == 'a')
+    assert_equal(db.get(where)['int'], 1)
+
+    db.remove(where)
+    assert_equal(len(db), 1)
+
+
+def test_insert_multiple_bulk():
+    db.purge()
+
+    ids = db.insert_multiple({'int': 1, 'char': c} for c in 'abc')
+
+    assert_equal(len(ids), 3)
+    assert_equal(len(db.search(field('int') == 1)), 3)
+    assert_equal(db.get(ids[1])['char'], 'b')
+
+
+def test_remove_returns_ids():
+    db.purge()
+
+    ids = db.insert_multiple({'int': i} for i in range(5))
+
+    assert_equal(sorted(db.remove(field('int') >= 3)), ids[3:])
+    assert_equal(sorted(db.remove(ids[:2] + [ids[4]])), ids[:2])
+    assert_equal(db.remove(ids[2]), [ids[2]])
+    assert_equal(len(db), 0)
+
+
+def test_search_limit():
+    db.purge()
+    db.insert_multiple({'int': i % 2} for i in range(10))
+
+    assert_equal(len(db.search(field('int') == 1, limit=3)), 3)
+    assert_equal(len(db.search(field('int') == 1, offset=3)), 2)
+    assert_equal(len(db.search(field('int') == 1, limit=3, offset=3)), 2)
+
+    # Cached results are sliced too
+    db.search(field('int') == 0)
+    assert_equal(len(db.search(field('int') == 0, limit=2)), 2)
+
+
+def test_search_iter():
+    db.purge()
+    db.insert_multiple({'int': i} for i in range(10))
+
+    tested = []
+
+    def test(value):
+        tested.append(value)
+        return value > 0
+
+    results = db.search_iter(field('int').test(test))
+    assert_true(next(results)['int'] > 0)
+    assert_true(next(results)['int'] > 0)
+    assert_true(len(tested) < 10)  # Stopped early
+
+
+def test_batch():
+    _db = TinyDB(storage=MemoryStorage)
+    table = _db.table('other')
+    writes = []
+    write = _db._storage.write
+
+    def counting_write(data):
+        writes.append(data)
+        write(data)
+
+    _db._storage.write = counting_write
+
+    with _db.batch():
+        _db.insert_multiple({'int': i} for i in range(5))
+        _db.remove(field('int') < 2)
+        _db.insert({'int': 5})
+
+        assert_equal(len(_db), 4)
+        assert_equal(writes, [])
+
+    assert_equal(len(writes), 1)
+
+    with table.batch():
+        table.insert({'int': 1})
+        _db.insert({'int': 6})
+
+    # Both tables have been written at once
+    assert_equal(len(writes), 2)
+    assert_equal(len(_db), 5)
+    assert_equal(len(table), 1)
+
+
+def test_batch_rollback():
+    _db = TinyDB(storage=MemoryStorage)
+    _db.create_index('int')
+    ids = _db.insert_multiple({'int': i} for i in range(3))
+
+    try:
+        with _db.batch():
+            _db.insert({'int': 3})
+            _db.remove(field('int') == 0)
+            assert_equal(len(_db.search(field('int') == 3)), 1)
+            raise RuntimeError
+    except RuntimeError:
+        pass
+
+    assert_equal(len(_db), 3)
+    assert_equal(_db.search(field('int') == 0), [{'int': 0}])
+    assert_equal(_db.search(field('int') == 3), [])
+    assert_equal(_db.insert({'int': 3}), ids[-1] + 1)
+
+
+def test_stats():
+    events = []
+    _db = TinyDB(storage=MemoryStorage, stats_callback=lambda *event:
+                 events.append(event))
+    _db.stats(reset=True)
+
+    _db.insert_multiple({'int': i} for i in range(3))
+    _db.search(field('int') == 1)
+    _db.create_index('int')
+    _db.search(field('int') == 2)
+
+    stats = _db.stats(reset=True)
+    assert_equal(stats['timings']['insert']['count'], 1)
+    assert_equal(stats['timings']['search']['count'], 2)
+    assert_equal(stats['timings']['storage_write']['count'], 1)
+    assert_equal(stats['counters']['full_scans'], 1)
+    assert_equal(stats['counters']['index_scans'], 1)
+    assert_true(('time', 'insert') in [event[:2] for event in events])
+
+    assert_equal(_db.stats()['counters'], {})
+
+
+class FieldStorage(MemoryStorage):
+    """
+    A storage decoding only the requested fields.
+    """
+
+    supports_field_reads = True
+    requested = None
+
+    def read_table(self, name, fields=None):
+        self.requested = fields
+        table = self.read()[name]
+
+        if fields is None:
+            return table
+
+        return dict((id, dict((key, value) for key, value in element.items()
+                              if key in fields))
+                    for id, element in table.items())
+
+
+def test_search_fields():
+    _db = TinyDB(storage=FieldStorage)
+    ids = _db.insert_multiple({'int': i, 'char': c, 'other': None}
+                              for i, c in enumerate('abc'))
+
+    assert_equal(_db.search(field('int') >= 1, fields=['char']),
+                 [{'char': 'b'}, {'char': 'c'}])
+    assert_equal(_db._storage.requested, set(['int', 'char']))
+    assert_equal(_db.get(field('char') == 'a', fields=['int', 'missing']),
+                 {'int': 0})
+    assert_equal(_db.get(ids[1], fields=['other']), {'other': None})
+    assert_equal(_db.search(ids[:2], fields=['int']), [{'int': 0}, {'int': 1}])
+
+    # Projected from cached whole elements as well
+    _db.search(field('int') == 2)
+    assert_equal(_db.search(field('int') == 2, fields=['char']),
+                 [{'char': 'c'}])
+    assert_equal(list(_db.search_iter(field('int') == 2, fields=['int'])),
+                 [{'int': 2}])
+
+
+def test_update():
+    db.purge()
+    db.create_index('int')
+    ids = db.insert_multiple({'int': i, 'char': c}
+                             for i, c in enumerate('abc'))
+
+    before = db.search(field('int') == 1)
+    assert_equal(db.update({'int': 5}, field('int') == 1), [ids[1]])
+
+    assert_equal(before, [{'int': 1, 'char': 'b'}])  # Not modified
+    assert_equal(db.search(field('int') == 1), [])
+    assert_equal(db.search(field('int') == 5), [{'int': 5, 'char': 'b'}])
+
+    def increment(element):
+        element['int'] += 1
+
+    assert_equal(sorted(db.update(increment, [ids[0], ids[2]])),
+                 [ids[0], ids[2]])
+    assert_equal(db.get(ids[2]), {'int': 3, 'char': 'c'})
+    assert_equal(db.get(field('int') == 1), {'int': 1, 'char': 'a'})
+
+    assert_raises(KeyError, db.update, {'int': 0}, 1000)
+
+    def failing(element):
+        element['char'] = 'x'
+        if element['int'] == 3:
+            raise RuntimeError
+
+    # Nothing is updated if updating any element fails
+    assert_raises(RuntimeError, db.update, failing, field('int') > 0)
+    assert_equal(db.search(field('char') == 'x'), [])
+    assert_equal(db.get(field('int') == 5), {'int': 5, 'char': 'b'})
+
+    db.drop_index('int')
+
+
+def test_count():
+    _db = TinyDB(storage=MemoryStorage)
+    _db.insert_multiple({'int': i % 3} for i in range(9))
+
+    reads = []
+    read = _db._storage.read
+
+    def counting_read():
+        reads.append(1)
+        return read()
+
+    _db._storage.read = counting_read
+
+    assert_equal(len(_db), 9)
+    assert_equal(reads, [])  # Maintained, not read
+
+    assert_equal(_db.count(field('int') == 1), 3)
+    assert_true(_db.contains(field('int') == 2))
+    assert_false(_db.contains(field('int') == 3))
+    assert_false((field('int') == 3) in _db)
+
+    _db.create_index('int', ordered=True)
+    del reads[:]
+    assert_equal(_db.count(field('int') >= 1), 6)
+    assert_true(_db.contains(field('int') < 1))
+    assert_equal(reads, [])  # Answered by the index
+
+    _db.remove(field('int') == 0)
+    assert_equal(len(_db), 6)
+    _db.purge_all()
+    assert_equal(len(_db), 0)
+
+
+def test_insert_multiple_failing():
+    _db = TinyDB(storage=MemoryStorage)
+    _db.create_index('int')
+    _db.insert({'int': 0})
+
+    def elements():
+        yield {'int': 1}
+        yield {'int': 2}
+        raise RuntimeError
+
+    assert_raises(RuntimeError, _db.insert_multiple, elements())
+
+    assert_equal(len(_db), 1)
+    assert_equal(len(_db.all()), 1)
+    assert_equal(_db.insert({'int': 1}), 2)
+    assert_equal(_db.search(field('int') == 1), [{'int': 1}])
+
+
+def _insert_shared(path):
+    _db = TinyDB(path, locking=True)
+    for i in range(20):
+        _db.insert({'int': i})
+
+
+def test_shared_between_processes():
+    tmp = tempfile.NamedTemporaryFile(delete=False)
+    tmp.close()
+
+    try:
+        processes = [Process(target=_insert_shared, args=(tmp.name, ))
+                     for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        # No insert got lost or reused another's ID
+        assert_equal(len(TinyDB(tmp.name, locking=True)), 4 * 20)
+
+        # Changes by others are noticed
+        db1 = TinyDB(tmp.name, locking=True)
+        db2 = TinyDB(tmp.name, locking=True)
+        db1.create_index('int')
+        assert_equal(db1.count(field('int') == 0), 4)
+        assert_equal(len(db1.search(field('int') == 1)), 4)
+
+        db2.insert({'int': 1})
+        db2.remove(field('int') == 0)
+        assert_equal(db1.count(field('int') == 0), 0)
+        assert_equal(len(db1.search(field('int') == 1)), 5)
+        assert_equal(db1.insert({'int': 0}), 4 * 20 + 2)
+        assert_equal(len(db2), 4 * 20 - 4 + 2)
+    finally:
+        os.unlink(tmp.name)
+
+
+def test_import_lazily():
+    # NumPy and multiprocessing are only imported by tables needing them
+    code = ('import sys, tinydb; '
+            'print(sorted(set(["numpy", "multiprocessing"]) & '
+            'set(sys.modules)))')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(tinydb.__file__)))
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=root)
+    assert_equal(output.strip(), b'[]')
+
+
+def test_lazy_storage():
+    tmp = tempfile.NamedTemporaryFile(delete=False)
+    tmp.close()
+
+    try:
+        with open(tmp.name, 'w') as f:
+            json.dump({'_default': dict([(str(i), {'int': i})
+                                         for i in range(1000)])}, f)
+
+        # Nothing is read on open, and getting an element reads only this
+        _db = TinyDB(tmp.name, storage=LazyJSONStorage, index_elements=True)
+        assert_equal(_db.stats()['counters'], {})
+
+        assert_equal(_db.get('5'), {'int': 5})
+        assert_equal(_db.stats()['counters']['bytes_read'],
+                     len(json.dumps({'int': 5})))
+        assert_raises(KeyError, _db.get, '1000')
+    finally:
+        os.unlink(tmp.name)
+        if os.path.exists(tmp.name + LazyJSONStorage.INDEX_SUFFIX):
+            os.unlink(tmp.name + LazyJSONStorage.INDEX_SUFFIX)
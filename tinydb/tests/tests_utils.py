@@ -0,0 +1,147 @@
+import time
+from threading import Event, Thread
+
+from nose.tools import *
+
+from tinydb.utils import LRUCache, ReadWriteLock, Stats
+
+
+def test_lru_cache():
+    cache = LRUCache(capacity=2)
+    cache['a'] = [1]
+    cache['b'] = [2]
+
+    assert_equal(cache.get('a'), [1])  # 'a' is now the most recently used
+    cache['c'] = [3]
+
+    assert_equal(cache.get('b'), None)
+    assert_equal(cache.get('c'), [3])
+    assert_equal(len(cache), 2)
+
+    info = cache.info()
+    assert_equal((info['hits'], info['misses'], info['evictions']), (2, 1, 1))
+
+
+def test_lru_cache_size():
+    cache = LRUCache(max_size=1000)
+    cache['a'] = range(10)
+    cache['b'] = range(10)
+    assert_true(cache.size <= 1000)
+
+    cache['c'] = range(1000)  # Too large to be cached at all
+    assert_equal(cache.get('c'), None)
+
+    cache.clear()
+    assert_equal((len(cache), cache.size), (0, 0))
+
+
+def test_lru_cache_threads():
+    cache = LRUCache(capacity=5)
+    errors = []
+
+    def use():
+        try:
+            for i in range(2000):
+                cache[i % 10] = [i]
+                cache.get((i + 3) % 10)
+                cache.discard((i + 7) % 10)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [Thread(target=use) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert_equal(errors, [])
+    assert_true(len(cache) <= 5)
+
+
+def test_read_write_lock_readers():
+    lock = ReadWriteLock()
+    inside = Event()
+
+    def read():
+        with lock.reader:
+            inside.set()
+
+    with lock.reader:
+        # Another reader can enter while we are reading
+        thread = Thread(target=read)
+        thread.start()
+        assert_true(inside.wait(5))
+
+    thread.join()
+
+
+def test_read_write_lock_writer_preference():
+    lock = ReadWriteLock()
+    events = []
+
+    def write():
+        with lock.writer:
+            events.append('write')
+
+    def read():
+        with lock.reader:
+            events.append('read')
+
+    lock.acquire_read()
+
+    writer = Thread(target=write)
+    writer.start()
+    while not lock._waiting_writers:
+        time.sleep(0.001)
+
+    # The new reader has to wait for the waiting writer
+    reader = Thread(target=read)
+    reader.start()
+    time.sleep(0.05)
+    assert_equal(events, [])
+
+    lock.release_read()
+    writer.join()
+    reader.join()
+
+    assert_equal(events, ['write', 'read'])
+
+
+def test_read_write_lock_reentrant():
+    lock = ReadWriteLock()
+
+    with lock.writer:
+        with lock.writer:
+            with lock.reader:
+                pass
+
+    with lock.reader:
+        with lock.reader:
+            assert_raises(RuntimeError, lock.acquire_write)
+
+
+def test_stats():
+    events = []
+    stats = Stats(lambda *event: events.append(event))
+
+    stats.count('scans')
+    stats.count('scans', 2)
+    stats.observe('search', 0.5)
+    with stats.timer('search'):
+        pass
+
+    snapshot = stats.snapshot()
+    assert_equal(snapshot['counters'], {'scans': 3})
+
+    timing = snapshot['timings']['search']
+    assert_equal(timing['count'], 2)
+    assert_equal(timing['max'], 0.5)
+    assert_equal(sum(n for _, n in timing['histogram']), 2)
+    assert_equal(dict(timing['histogram'])[1.0], 1)
+
+    assert_equal([event[:2] for event in events],
+                 [('count', 'scans'), ('count', 'scans'), ('time', 'search'),
+                  ('time', 'search')])
+
+    stats.reset()
+    assert_equal(stats.snapshot(), {'counters': {}, 'timings': {}})
@@ -0,0 +1,314 @@
+"""
+Utility classes used by TinyDB.
+"""
+
+import sys
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Condition, Lock, current_thread
+from timeit import default_timer
+
+
+class LRUCache(object):
+    """
+    A cache keeping only the least recently used entries.
+
+    The cache holds at most ``capacity`` entries with an approximate total
+    size of at most ``max_size`` bytes. If adding an entry exceeds one of
+    these limits, the least recently used entries are evicted. Both limits
+    are optional.
+
+    The size of an entry is the size of the value plus the sizes of the
+    items it contains (not counting anything nested deeper).
+
+    The cache can be used by multiple threads at the same time.
+    """
+
+    def __init__(self, capacity=None, max_size=None):
+        self.capacity = capacity
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0
+
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """
+        Get the value of an entry and mark it as recently used.
+        """
+        with self._lock:
+            try:
+                entry = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._entries[key] = entry
+            self.hits += 1
+
+            return entry[0]
+
+    def __setitem__(self, key, value):
+        size = sys.getsizeof(value)
+        try:
+            size += sum([sys.getsizeof(item) for item in value])
+        except TypeError:
+            pass  # Not iterable
+
+        with self._lock:
+            self._discard(key)
+
+            if self.capacity == 0 or (self.max_size is not None and
+                                      size > self.max_size):
+                return  # Doesn't fit into the cache
+
+            self._entries[key] = (value, size)
+            self.size += size
+
+            while ((self.capacity is not None and
+                    len(self._entries) > self.capacity) or
+                   (self.max_size is not None and self.size > self.max_size)):
+                _, (_, size) = self._entries.popitem(last=False)
+                self.size -= size
+                self.evictions += 1
+
+    def discard(self, key):
+        """
+        Remove an entry if it is cached.
+        """
+        with self._lock:
+            self._discard(key)
+
+    def _discard(self, key):
+        try:
+            _, size = self._entries.pop(key)
+        except KeyError:
+            return
+
+        self.size -= size
+
+    def clear(self):
+        """
+        Remove all entries. The statistics are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def info(self):
+        """
+        Get statistics about the cache usage.
+
+        :returns: the number of hits, misses and evictions as well as the
+                  current number of entries (``entries``) and their
+                  approximate total size in bytes (``size``)
+        :rtype: dict
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'entries': len(self),
+                    'size': self.size}
+
+
+class _LockContext(object):
+    """
+    Use one side of a :class:`ReadWriteLock` in a ``with`` statement.
+    """
+
+    def __init__(self, acquire, release):
+        self.acquire = acquire
+        self.release = release
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class ReadWriteLock(object):
+    """
+    A lock allowing either multiple readers or a single writer at a time.
+
+    Waiting writers are preferred over new readers, so a steady stream of
+    readers can't starve writers. The lock is reentrant: a reader may
+    acquire the read lock again, the writer may acquire both the read and
+    the write lock again. A reader can't acquire the write lock.
+
+    >>> lock = ReadWriteLock()
+    >>> with lock.reader:
+    ...     pass  # Reading
+    >>> with lock.writer:
+    ...     pass  # Writing
+    """
+
+    def __init__(self):
+        self._cond = Condition(Lock())
+        self._readers = {}  # thread -> number of times it acquired
+        self._writer = None
+        self._writer_count = 0
+        self._waiting_writers = 0
+
+        self.reader = _LockContext(self.acquire_read, self.release_read)
+        self.writer = _LockContext(self.acquire_write, self.release_write)
+
+    def acquire_read(self):
+        me = current_thread()
+
+        with self._cond:
+            if me not in self._readers and self._writer is not me:
+                while self._writer is not None or self._waiting_writers:
+                    self._cond.wait()
+
+            self._readers[me] = self._readers.get(me, 0) + 1
+
+    def release_read(self):
+        me = current_thread()
+
+        with self._cond:
+            if self._readers[me] > 1:
+                self._readers[me] -= 1
+            else:
+                del self._readers[me]
+
+                if not self._readers:
+                    self._cond.notify_all()
+
+    def acquire_write(self):
+        me = current_thread()
+
+        with self._cond:
+            if self._writer is me:
+                self._writer_count += 1
+                return
+
+            if me in self._readers:
+                raise RuntimeError('Cannot upgrade a read lock to a write '
+                                   'lock')
+
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+
+            self._writer = me
+            self._writer_count = 1
+
+    def release_write(self):
+        with self._cond:
+            self._writer_count -= 1
+
+            if not self._writer_count:
+                self._writer = None
+                self._cond.notify_all()
+
+
+class Stats(object):
+    """
+    Counters and timing histograms of database operations.
+
+    Counters count events (e.g. ``bytes_written`` or ``full_scans``), timings
+    record how long operations took (e.g. ``search`` or ``storage_write``).
+    If a ``callback`` is given, it is called with ``('count', name, value)``
+    for every counted event and with ``('time', name, seconds)`` for every
+    timed operation, e.g. to export them to a metrics system.
+
+    >>> stats = Stats()
+    >>> with stats.timer('search'):
+    ...     pass  # Searching
+    >>> stats.count('full_scans')
+    """
+
+    #: The upper bounds of the timing histograms' buckets (in seconds). The
+    #: last bucket counts everything slower.
+    BUCKETS = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0, 10.0)
+
+    def __init__(self, callback=None):
+        self.callback = callback
+
+        self._lock = Lock()
+        self._counters = {}
+        self._timings = {}  # name -> [count, total, max, histogram]
+
+    def count(self, name, value=1):
+        """
+        Add ``value`` to a counter.
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+        if self.callback is not None:
+            self.callback('count', name, value)
+
+    def observe(self, name, seconds):
+        """
+        Record the duration of an operation.
+        """
+        bucket = bisect_left(self.BUCKETS, seconds)
+
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                timing = [0, 0.0, 0.0, [0] * (len(self.BUCKETS) + 1)]
+                self._timings[name] = timing
+
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+            timing[3][bucket] += 1
+
+        if self.callback is not None:
+            self.callback('time', name, seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Record the duration of the ``with`` block.
+        """
+        start = default_timer()
+        try:
+            yield
+        finally:
+            self.observe(name, default_timer() - start)
+
+    def snapshot(self):
+        """
+        Get the current statistics.
+
+        :returns: the counters (``counters``) and for every timing
+                  (``timings``) the number of operations, their total and
+                  maximum duration and the histogram as a list of
+                  ``(upper bound, count)`` pairs. The last bucket's bound
+                  is None.
+        :rtype: dict
+        """
+        bounds = self.BUCKETS + (None, )
+
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'timings': dict([
+                    (name, {'count': count, 'total': total, 'max': slowest,
+                            'histogram': list(zip(bounds, histogram))})
+                    for name, (count, total, slowest, histogram)
+                    in self._timings.items()
+                ])
+            }
+
+    def reset(self):
+        """
+        Reset all counters and timings.
+        """
+        with self._lock:
+            self._counters = {}
+            self._timings = {}